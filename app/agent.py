@@ -1,34 +1,103 @@
 from typing import TypedDict
-from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
+from langgraph.constants import END
 from app.routing import route_input
-from app.tools import send_exercise_fn, send_reminder_fn, check_feedback_fn
+from app.tools import send_exercise_fn, send_reminder_fn, check_feedback_fn, refresh_due
 from app.scheduler import schedule_session_fn
 from app.memory import memory_store
-from app.coach import fetch_coach_instructions, parse_coach_prompt
+from app.answer_cache import answer_cache
+from app.llm_batcher import LLMBatcher
+from app.resilience import ResilientCaller, CircuitOpenError, SaturatedError, is_transient, LLM_REQUEST_TIMEOUT
+from app.coach import coach_flags
+from app.metrics import LLM_SECONDS, timed_node, timed_router
 import os
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
+import asyncio
+import contextvars
 import logging
 import re
+import threading
+import time
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Load .env
-load_dotenv()
-
-# Initialize DeepSeek LLM with timeout
-llm = ChatOpenAI(
-    model="deepseek/deepseek-chat-v3-0324:free",
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-    temperature=0.2,
-    max_tokens=1000,
-    timeout=30,
+# DeepSeek LLM client, built on first use (see get_llm)
+llm = None
+_llm_lock = threading.Lock()
+
+def get_llm():
+    """Return the shared LLM client, creating it on first use.
+
+    langchain_openai is imported here so importing the app stays fast.
+    """
+    global llm
+    if llm is None:
+        with _llm_lock:
+            if llm is None:
+                from langchain_openai import ChatOpenAI
+                llm = ChatOpenAI(
+                    model="deepseek/deepseek-chat-v3-0324:free",
+                    base_url="https://openrouter.ai/api/v1",
+                    api_key=os.getenv("OPENROUTER_API_KEY"),
+                    temperature=0.2,
+                    max_tokens=1000,
+                    timeout=LLM_REQUEST_TIMEOUT,
+                    # llm_guard owns retries, bounded by its call deadline
+                    max_retries=0,
+                )
+    return llm
+
+# Concurrency limit, retries and circuit breaker around every LLM call
+llm_guard = ResilientCaller()
+
+# Coalesces concurrent prompts from both answer nodes into llm.batch calls; every
+# LLM call goes through it except streamed answers, which need llm.ainvoke
+llm_batcher = LLMBatcher(get_llm, guard=llm_guard)
+
+# Set while stream_agent runs, so the async answer node streams tokens instead of batching
+_streaming = contextvars.ContextVar("streaming", default=False)
+
+# Served when the LLM is unavailable, instead of holding the request
+FALLBACK_ANSWER = (
+    "I can't reach the coaching assistant right now, so I can't answer that in detail. "
+    "Please ask again in a few minutes - and keep going with today's exercise!"
 )
 
+def _llm_unavailable(error: Exception) -> bool:
+    return isinstance(error, (CircuitOpenError, SaturatedError)) or is_transient(error)
+
+def call_llm(prompt: str):
+    """Guarded, batched LLM call, timed into llm_call_duration_seconds."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        # The batcher holds llm_guard's slots while its requests are in flight, not while prompts wait
+        response = llm_guard.call(lambda: llm_batcher.invoke(prompt, timeout=llm_guard.deadline),
+                                  hold_slot=False)
+        outcome = "success"
+        return response
+    except (CircuitOpenError, SaturatedError):
+        outcome = "rejected"
+        raise
+    finally:
+        LLM_SECONDS.observe(time.perf_counter() - start, mode="sync", outcome=outcome)
+
+async def acall_llm(prompt: str):
+    """Async call_llm; under stream_agent it goes straight to llm.ainvoke so tokens can stream."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        if _streaming.get():
+            response = await llm_guard.acall(lambda: get_llm().ainvoke(prompt))
+        else:
+            response = await llm_guard.acall(lambda: llm_batcher.ainvoke(prompt), hold_slot=False)
+        outcome = "success"
+        return response
+    except (CircuitOpenError, SaturatedError):
+        outcome = "rejected"
+        raise
+    finally:
+        LLM_SECONDS.observe(time.perf_counter() - start, mode="async", outcome=outcome)
+
 # Define AgentState
 class AgentState(TypedDict):
     input: str
@@ -42,25 +111,24 @@ def send_exercise_node(state: AgentState) -> dict:
     user_id = state["user_id"]
     coach_id = state["coach_id"]
     
-    instruction = fetch_coach_instructions(user_id, coach_id)
-    parsed_instruction = parse_coach_prompt(instruction.get("prompt", ""))
-    
     session = memory_store.get(user_id) or {}
+    parsed_instruction = coach_flags(user_id, coach_id, session)
+    
     user_goals = session.get("goals", "your fitness goals")
     
     try:
         result = send_exercise_fn(user_id)
-        memory_store.update(user_id, {"last_exercise": result, "reminders_sent": 0})
+        memory_store.patch(user_id, {"last_exercise": result, "reminders_sent": 0})
         
         message = f"Here's your daily exercise: {result}"
         if parsed_instruction["include_goals"]:
             message += f"\nKeep working toward {user_goals}!"
         if parsed_instruction["warning_tone"]:
             message += "\nStay consistent to avoid falling behind!"
-        logger.debug(f"send_exercise_node: {message}")
+        logger.debug("send_exercise_node: %s", message)
         return {"node_output": message}
     except Exception as e:
-        logger.error(f"send_exercise_node error: {str(e)}")
+        logger.error("send_exercise_node error: %s", e)
         return {"node_output": f"Error sending exercise: {str(e)}"}
 
 def send_reminder_node(state: AgentState) -> dict:
@@ -68,10 +136,7 @@ def send_reminder_node(state: AgentState) -> dict:
     user_id = state["user_id"]
     coach_id = state["coach_id"]
     session = memory_store.get(user_id) or {}
-    reminders = session.get("reminders_sent", 0)
-    
-    instruction = fetch_coach_instructions(user_id, coach_id)
-    parsed_instruction = parse_coach_prompt(instruction.get("prompt", ""))
+    parsed_instruction = coach_flags(user_id, coach_id, session)
     
     user_goals = session.get("goals", "your fitness goals")
     last_exercise_date = session.get("last_exercise_date")
@@ -81,17 +146,17 @@ def send_reminder_node(state: AgentState) -> dict:
         warning_triggered = days_since >= 3
     
     try:
+        # send_reminder_fn increments reminders_sent atomically
         result = send_reminder_fn(user_id)
         message = result
         if parsed_instruction["include_goals"]:
             message += f"\nThis will help you reach {user_goals}."
         if warning_triggered:
             message += "\nWarning: You haven't exercised in over 3 days. Get back on track!"
-        memory_store.update(user_id, {"reminders_sent": reminders + 1})
-        logger.debug(f"send_reminder_node: {message}")
+        logger.debug("send_reminder_node: %s", message)
         return {"node_output": message}
     except Exception as e:
-        logger.error(f"send_reminder_node error: {str(e)}")
+        logger.error("send_reminder_node error: %s", e)
         return {"node_output": f"Error sending reminder: {str(e)}"}
 
 def check_feedback_node(state: AgentState) -> dict:
@@ -103,10 +168,10 @@ def check_feedback_node(state: AgentState) -> dict:
             message = f"Thanks for completing your exercise! Your feedback: '{result}'"
         else:
             message = "Still waiting for your feedback. Please let me know when you're done!"
-        logger.debug(f"check_feedback_node: {message}")
+        logger.debug("check_feedback_node: %s", message)
         return {"node_output": message}
     except Exception as e:
-        logger.error(f"check_feedback_node error: {str(e)}")
+        logger.error("check_feedback_node error: %s", e)
         return {"node_output": f"Error checking feedback: {str(e)}"}
 
 def schedule_node(state: AgentState) -> dict:
@@ -125,7 +190,7 @@ def schedule_node(state: AgentState) -> dict:
                 parsed_time = datetime.strptime(time_str, "%H:%M")
             hour, minute = parsed_time.hour, parsed_time.minute
         except ValueError:
-            logger.error(f"Invalid time format: {time_str}")
+            logger.error("Invalid time format: %s", time_str)
             time_str = "12:00"
             hour, minute = 12, 0
         result = schedule_session_fn(user_id, time_str)
@@ -134,11 +199,12 @@ def schedule_node(state: AgentState) -> dict:
             "scheduled_hour": hour,
             "scheduled_minute": minute
         })
+        refresh_due(user_id)
         message = f"Session scheduled for {time_str}: {result}"
-        logger.debug(f"schedule_node: {message}")
+        logger.debug("schedule_node: %s", message)
         return {"node_output": message}
     except Exception as e:
-        logger.error(f"schedule_node error: {str(e)}")
+        logger.error("schedule_node error: %s", e)
         return {"node_output": f"Error scheduling session: {str(e)}"}
 
 def answer_workout_question_node(state: AgentState) -> dict:
@@ -146,45 +212,65 @@ def answer_workout_question_node(state: AgentState) -> dict:
     user_id = state["user_id"]
     question = state["input"]
     try:
-        response = llm.invoke(f"Answer this workout question: {question}")
-        logger.debug(f"LLM response: {response.content}")
+        cached = answer_cache.get(question)
+        if cached is not None:
+            logger.debug("Answer cache hit: %s", question)
+            return {"node_output": cached}
+        prompt = f"Answer this workout question: {question}"
+        response = call_llm(prompt)
+        logger.debug("LLM response: %s", response.content)
+        answer_cache.set(question, response.content)
         return {"node_output": response.content}
     except Exception as e:
-        logger.error(f"LLM error: {str(e)}")
+        logger.error("LLM error: %s", e)
+        if _llm_unavailable(e):
+            return {"node_output": FALLBACK_ANSWER}
         return {"node_output": f"Error answering question: {str(e)}"}
 
+async def answer_workout_question_node_async(state: AgentState) -> dict:
+    """Answer workout-related questions using LLM without blocking the event loop."""
+    question = state["input"]
+    try:
+        cached = await asyncio.to_thread(answer_cache.get, question)
+        if cached is not None:
+            logger.debug("Answer cache hit: %s", question)
+            return {"node_output": cached}
+        prompt = f"Answer this workout question: {question}"
+        response = await acall_llm(prompt)
+        logger.debug("LLM response: %s", response.content)
+        await asyncio.to_thread(answer_cache.set, question, response.content)
+        return {"node_output": response.content}
+    except Exception as e:
+        logger.error("LLM error: %s", e)
+        if _llm_unavailable(e):
+            return {"node_output": FALLBACK_ANSWER}
+        return {"node_output": f"Error answering question: {str(e)}"}
+
+def router_node(state: AgentState) -> dict:
+    """Graph entry point; the turn's action node is chosen by route_to_node on its way out."""
+    return {}
+
 def finalize_node(state: AgentState) -> dict:
     """Add viral loop and finalize response."""
     try:
         node_output = state.get("node_output", "")
         coach_id = state["coach_id"]
         viral_text = f"\nPowered by MyAgentsAI: https://myagents.ai/signup?ref={coach_id}"
-        logger.debug(f"finalize_node: {node_output}{viral_text}")
+        logger.debug("finalize_node: %s%s", node_output, viral_text)
         return {"output": f"{node_output}{viral_text}"}
     except Exception as e:
-        logger.error(f"finalize_node error: {str(e)}")
+        logger.error("finalize_node error: %s", e)
         return {"output": f"Error finalizing response: {str(e)}"}
 
 def route_to_node(state: AgentState) -> str:
     """Route input to appropriate node, considering coach instructions."""
-    logger.debug(f"Routing state: {state}")
+    logger.debug("Routing state: %s", state)
     try:
-        if state.get("output"):
-            logger.debug("Output exists, returning END")
-            return END
-        
         user_id = state["user_id"]
         coach_id = state["coach_id"]
-        session = memory_store.get(user_id) or {}
-        user_input = state["input"].lower()
-        logger.debug(f"Session: {session}")
-        
-        instruction = fetch_coach_instructions(user_id, coach_id)
-        parsed_instruction = parse_coach_prompt(instruction.get("prompt", ""))
-        logger.debug(f"Parsed instruction: {parsed_instruction}")
         
-        intent = route_input(user_input, user_id)
-        logger.debug(f"Intent: {intent}")
+        intent = route_input(state["input"], user_id)
+        logger.debug("Intent: %s", intent)
         if intent == "schedule":
             logger.debug("Routing to schedule")
             return "schedule"
@@ -201,6 +287,12 @@ def route_to_node(state: AgentState) -> str:
             logger.debug("Routing to send_exercise")
             return "send_exercise"
         
+        # Only reached for intents without a node of their own
+        session = memory_store.get(user_id) or {}
+        logger.debug("Session: %s", session)
+        parsed_instruction = coach_flags(user_id, coach_id, session)
+        logger.debug("Parsed instruction: %s", parsed_instruction)
+        
         if not session.get("last_exercise"):
             logger.debug("No last_exercise, routing to send_exercise")
             return "send_exercise"
@@ -208,12 +300,14 @@ def route_to_node(state: AgentState) -> str:
             if session.get("reminders_sent", 0) < 3 and parsed_instruction["warning_tone"] and session.get("last_exercise_date"):
                 try:
                     days_since = (datetime.now().date() - datetime.fromisoformat(session["last_exercise_date"]).date()).days
-                    logger.debug(f"Days since: {days_since}, Warning tone: {parsed_instruction['warning_tone']}, Reminders sent: {session.get('reminders_sent', 0)}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Days since: %s, Warning tone: %s, Reminders sent: %s",
+                                     days_since, parsed_instruction['warning_tone'], session.get('reminders_sent', 0))
                     if days_since >= 3:
                         logger.debug("Routing to send_reminder due to warning and inactivity")
                         return "send_reminder"
                 except ValueError as e:
-                    logger.error(f"Date parsing error: {e}")
+                    logger.error("Date parsing error: %s", e)
             if session.get("reminders_sent", 0) < 3:
                 logger.debug("Routing to send_reminder due to no feedback and reminders < 3")
                 return "send_reminder"
@@ -223,20 +317,43 @@ def route_to_node(state: AgentState) -> str:
         logger.debug("Default routing to send_exercise")
         return "send_exercise"
     except Exception as e:
-        logger.error(f"route_to_node error: {str(e)}")
+        logger.error("route_to_node error: %s", e)
         return END
 
-def build_graph():
+# Nodes the router picks from; each turn runs exactly one of them, then finalize
+ACTION_NODES = ("send_exercise", "send_reminder", "check_feedback", "schedule", "answer_workout_question")
+
+# Node registration; the compiled graph is rebuilt whenever this changes
+NODES = {
+    "router": router_node,
+    "send_exercise": send_exercise_node,
+    "send_reminder": send_reminder_node,
+    "check_feedback": check_feedback_node,
+    "schedule": schedule_node,
+    "answer_workout_question": answer_workout_question_node,
+    "finalize": finalize_node,
+}
+
+# Replacements used by the async graph; sync nodes run in LangGraph's executor
+ASYNC_NODES = {
+    "answer_workout_question": answer_workout_question_node_async,
+}
+
+_graph_lock = threading.Lock()
+_graph_cache = {}  # async_mode -> (node registration, compiled graph)
+
+def _registered_nodes(async_mode: bool = False) -> dict:
+    return {**NODES, **ASYNC_NODES} if async_mode else dict(NODES)
+
+def build_graph(async_mode: bool = False):
+    from langgraph.graph import StateGraph
     try:
         graph = StateGraph(AgentState)
-        graph.add_node("send_exercise", send_exercise_node)
-        graph.add_node("send_reminder", send_reminder_node)
-        graph.add_node("check_feedback", check_feedback_node)
-        graph.add_node("schedule", schedule_node)
-        graph.add_node("answer_workout_question", answer_workout_question_node)
-        graph.add_node("finalize", finalize_node)
+        for name, node in _registered_nodes(async_mode).items():
+            graph.add_node(name, timed_node(name, node))
+        graph.set_entry_point("router")
         graph.add_conditional_edges(
-            "send_exercise", route_to_node, 
+            "router", timed_router(route_to_node),
             {
                 "send_exercise": "send_exercise",
                 "send_reminder": "send_reminder",
@@ -246,71 +363,84 @@ def build_graph():
                 END: END
             }
         )
-        graph.add_conditional_edges(
-            "send_reminder", route_to_node, 
-            {
-                "send_exercise": "send_exercise",
-                "send_reminder": "send_reminder",
-                "check_feedback": "check_feedback",
-                "schedule": "schedule",
-                "answer_workout_question": "answer_workout_question",
-                END: END
-            }
-        )
-        graph.add_conditional_edges(
-            "check_feedback", route_to_node, 
-            {
-                "send_exercise": "send_exercise",
-                "send_reminder": "send_reminder",
-                "check_feedback": "check_feedback",
-                "schedule": "schedule",
-                "answer_workout_question": "answer_workout_question",
-                END: END
-            }
-        )
-        graph.add_conditional_edges(
-            "schedule", route_to_node, 
-            {
-                "send_exercise": "send_exercise",
-                "send_reminder": "send_reminder",
-                "check_feedback": "check_feedback",
-                "schedule": "schedule",
-                "answer_workout_question": "answer_workout_question",
-                END: END
-            }
-        )
-        graph.add_conditional_edges(
-            "answer_workout_question", route_to_node, 
-            {
-                "send_exercise": "send_exercise",
-                "send_reminder": "send_reminder",
-                "check_feedback": "check_feedback",
-                "schedule": "schedule",
-                "answer_workout_question": "answer_workout_question",
-                END: END
-            }
-        )
-        graph.add_edge("send_exercise", "finalize")
-        graph.add_edge("send_reminder", "finalize")
-        graph.add_edge("check_feedback", "finalize")
-        graph.add_edge("schedule", "finalize")
-        graph.add_edge("answer_workout_question", "finalize")
-        graph.set_entry_point("send_exercise")
+        for action in ACTION_NODES:
+            graph.add_edge(action, "finalize")
         graph.set_finish_point("finalize")
         logger.debug("Graph built successfully")
         return graph.compile()
     except Exception as e:
-        logger.error(f"build_graph error: {str(e)}")
+        logger.error("build_graph error: %s", e)
         raise
 
+def get_graph(async_mode: bool = False):
+    """Return the compiled graph, building it once per node registration."""
+    key = tuple(_registered_nodes(async_mode).items())
+    cached = _graph_cache.get(async_mode)
+    if cached is None or cached[0] != key:
+        with _graph_lock:
+            cached = _graph_cache.get(async_mode)
+            if cached is None or cached[0] != key:
+                cached = (key, build_graph(async_mode))
+                _graph_cache[async_mode] = cached
+    return cached[1]
+
+def reset_graph():
+    """Drop the cached graphs so the next run recompiles them."""
+    with _graph_lock:
+        _graph_cache.clear()
+
 def run_agent(state: AgentState) -> str:
     """Run the agent with the given state."""
     try:
-        graph = build_graph()
-        logger.debug(f"Invoking graph with state: {state}")
-        result = graph.invoke(state)
-        logger.debug(f"run_agent result: {result}")
+        graph = get_graph()
+        logger.debug("Invoking graph with state: %s", state)
+        # One read at the start and one write at the end for the whole run
+        with memory_store.session(state["user_id"]):
+            result = graph.invoke(state)
+        logger.debug("run_agent result: %s", result)
+        return result["output"]
+    except Exception as e:
+        logger.error("run_agent error: %s", e, extra={"user_id": state.get("user_id")})
+        raise
+
+async def run_agent_async(state: AgentState) -> str:
+    """Run the agent with the given state on the event loop."""
+    try:
+        graph = get_graph(async_mode=True)
+        logger.debug("Invoking async graph with state: %s", state)
+        async with memory_store.asession(state["user_id"]):
+            result = await graph.ainvoke(state)
+        logger.debug("run_agent_async result: %s", result)
         return result["output"]
     except Exception as e:
-        logger.error(f"run_agent error: {str(e)}")
-        raise
\ No newline at end of file
+        logger.error("run_agent_async error: %s", e, extra={"user_id": state.get("user_id")})
+        raise
+
+async def stream_agent(state: AgentState):
+    """Run the agent and yield response text as it is produced.
+
+    LLM tokens are yielded as they stream; whatever the final output adds
+    after them (the finalize footer, or the whole message for non-LLM nodes)
+    is yielded once the graph finishes.
+    """
+    graph = get_graph(async_mode=True)
+    streamed = ""
+    output = ""
+    token = _streaming.set(True)
+    try:
+        async with memory_store.asession(state["user_id"]):
+            async for event in graph.astream_events(state, version="v2"):
+                if event["event"] == "on_chat_model_stream":
+                    text = event["data"]["chunk"].content
+                    if text:
+                        streamed += text
+                        yield text
+                elif event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                    output = event["data"]["output"]["output"]
+    finally:
+        _streaming.reset(token)
+    logger.debug("stream_agent result: %s", output)
+    if streamed and output.startswith(streamed):
+        yield output[len(streamed):]
+    else:
+        yield ("\n" if streamed else "") + output
@@ -0,0 +1,141 @@
+# app/answer_cache.py
+from typing import Any, Dict, Optional
+from app.cache import LRUCache
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# Semantic tier: embeds questions with Chroma's local embedding model
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "false").lower() in ("1", "true", "yes")
+ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.1"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", question.lower())).strip()
+
+class AnswerCache:
+    """Cache of LLM answers keyed by question.
+
+    The exact tier matches normalized question text. The optional semantic
+    tier stores question embeddings in a Chroma collection and reuses the
+    answer of the nearest stored question within max_distance (cosine).
+    """
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 semantic: bool = ANSWER_CACHE_SEMANTIC, max_distance: float = ANSWER_CACHE_MAX_DISTANCE,
+                 embedding_function: Any = None, collection_name: str = "answer_cache"):
+        self.exact = LRUCache(maxsize, ttl or None)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.semantic = semantic
+        self.max_distance = max_distance
+        self.embedding_function = embedding_function
+        self.collection_name = collection_name
+        self.semantic_hits = 0
+        self.misses = 0
+        self._collection = None
+        self._inserts = 0
+        self._lock = threading.Lock()
+
+    def _semantic_collection(self):
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    import chromadb
+                    kwargs = {"configuration": {"hnsw": {"space": "cosine"}}}
+                    if self.embedding_function is not None:
+                        kwargs["embedding_function"] = self.embedding_function
+                    self._collection = chromadb.Client().get_or_create_collection(self.collection_name, **kwargs)
+        return self._collection
+
+    def _lookup_semantic(self, key: str) -> Optional[str]:
+        results = self._semantic_collection().query(query_texts=[key], n_results=1)
+        if not results["ids"] or not results["ids"][0]:
+            return None
+        distance = results["distances"][0][0]
+        metadata = results["metadatas"][0][0]
+        if distance > self.max_distance:
+            return None
+        if self.ttl and time.time() - metadata["stored_at"] > self.ttl:
+            return None
+        return metadata["answer"]
+
+    def get(self, question: str) -> Optional[str]:
+        key = normalize_question(question)
+        answer = self.exact.get(key)
+        if answer is not None:
+            return answer
+        if self.semantic:
+            try:
+                answer = self._lookup_semantic(key)
+            except Exception as e:
+                logger.error("answer cache semantic lookup error: %s", e)
+                answer = None
+            if answer is not None:
+                self.semantic_hits += 1
+                self.exact.set(key, answer)
+                return answer
+        self.misses += 1
+        return None
+
+    def set(self, question: str, answer: str):
+        key = normalize_question(question)
+        self.exact.set(key, answer)
+        if not self.semantic:
+            return
+        try:
+            self._semantic_collection().upsert(
+                ids=[hashlib.sha1(key.encode()).hexdigest()],
+                documents=[key],
+                metadatas=[{"answer": answer, "stored_at": time.time()}]
+            )
+            self._inserts += 1
+            if self._inserts % 100 == 0:
+                self._prune()
+        except Exception as e:
+            logger.error("answer cache semantic store error: %s", e)
+
+    def _prune(self):
+        """Drop expired semantic entries, then the oldest ones beyond maxsize."""
+        collection = self._semantic_collection()
+        entries = collection.get(include=["metadatas"])
+        ranked = sorted(zip(entries["ids"], entries["metadatas"]), key=lambda entry: entry[1]["stored_at"])
+        now = time.time()
+        stale = [entry_id for entry_id, metadata in ranked
+                 if self.ttl and now - metadata["stored_at"] > self.ttl]
+        expired = set(stale)
+        fresh = [entry_id for entry_id, _ in ranked if entry_id not in expired]
+        stale += fresh[:max(0, len(fresh) - self.maxsize)]
+        if stale:
+            collection.delete(ids=stale)
+
+    def clear(self):
+        self.exact.clear()
+        if self._collection is not None:
+            ids = self._collection.get(include=[])["ids"]
+            if ids:
+                self._collection.delete(ids=ids)
+
+    def stats(self) -> Dict[str, Any]:
+        exact_hits = self.exact.hits
+        lookups = exact_hits + self.semantic_hits + self.misses
+        return {
+            "size": len(self.exact),
+            "exact_hits": exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "evictions": self.exact.evictions,
+            "hit_rate": (exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+answer_cache = AnswerCache()
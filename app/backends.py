@@ -0,0 +1,187 @@
+# app/backends.py
+from typing import Dict, Any, Iterable, List, Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Backend selection: "chroma" (default), "sqlite" or "memory"
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "chroma").lower()
+CHROMA_PATH = os.getenv("CHROMA_PATH")  # unset keeps the ephemeral in-process client
+SQLITE_PATH = os.getenv("SQLITE_PATH", "sessions.db")
+
+class SessionBackend:
+    """Key-value storage for JSON user documents, one document per user_id."""
+
+    def read(self, user_id: str) -> Dict[str, Any]:
+        """Return the user's document, or {} if there is none."""
+        raise NotImplementedError
+
+    def read_many(self, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the documents that exist among user_ids, in one round trip where possible."""
+        return {user_id: data for user_id in user_ids if (data := self.read(user_id))}
+
+    def ids(self) -> List[str]:
+        """Return every stored user_id."""
+        raise NotImplementedError
+
+    def write(self, items: Dict[str, Dict[str, Any]]):
+        """Insert or replace the documents for every user_id in items."""
+        raise NotImplementedError
+
+    def remove(self, user_id: str):
+        """Delete the user's document if it exists."""
+        raise NotImplementedError
+
+class InMemoryBackend(SessionBackend):
+    """Process-local dict; nothing survives a restart. Useful for tests and benchmarks."""
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def read(self, user_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._data.get(user_id, {}))
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._data)
+
+    def write(self, items: Dict[str, Dict[str, Any]]):
+        with self._lock:
+            for user_id, data in items.items():
+                self._data[user_id] = dict(data)
+
+    def remove(self, user_id: str):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+class ChromaBackend(SessionBackend):
+    """Documents in a ChromaDB collection.
+
+    Every document is stored with a constant placeholder embedding, so Chroma
+    never runs its embedding model; the collection is only used for lookup by id.
+    """
+
+    _EMBEDDING = [0.0]
+
+    def __init__(self, path: Optional[str] = CHROMA_PATH, collection: str = "user_data"):
+        import chromadb
+        self.client = chromadb.PersistentClient(path=path) if path else chromadb.Client()
+        self.collection = self.client.get_or_create_collection(collection)
+
+    def read(self, user_id: str) -> Dict[str, Any]:
+        results = self.collection.get(ids=[user_id])
+        if results['documents'] and results['documents'][0]:
+            return json.loads(results['documents'][0])
+        return {}
+
+    def read_many(self, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        results = self.collection.get(ids=user_ids)
+        return {
+            user_id: json.loads(document)
+            for user_id, document in zip(results['ids'], results['documents'])
+            if document
+        }
+
+    def ids(self) -> List[str]:
+        return self.collection.get(include=[])['ids']
+
+    def write(self, items: Dict[str, Dict[str, Any]]):
+        self.collection.upsert(
+            ids=list(items),
+            documents=[json.dumps(data) for data in items.values()],
+            embeddings=[self._EMBEDDING] * len(items)
+        )
+
+    def remove(self, user_id: str):
+        self.collection.delete(ids=[user_id])
+
+class SQLiteBackend(SessionBackend):
+    """One row per user with the document in a JSON text column, in WAL mode."""
+
+    def __init__(self, path: str = SQLITE_PATH, table: str = "sessions"):
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "user_id TEXT PRIMARY KEY, "
+                "data TEXT NOT NULL CHECK (json_valid(data)), "
+                "updated_at REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def read(self, user_id: str) -> Dict[str, Any]:
+        row = self._conn().execute(
+            f"SELECT data FROM {self.table} WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def read_many(self, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        user_ids = list(user_ids)
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn().execute(
+                f"SELECT user_id, data FROM {self.table} WHERE user_id IN ({placeholders})", chunk
+            ).fetchall()
+            found.update((user_id, json.loads(data)) for user_id, data in rows)
+        return found
+
+    def ids(self) -> List[str]:
+        return [row[0] for row in self._conn().execute(f"SELECT user_id FROM {self.table}")]
+
+    def write(self, items: Dict[str, Dict[str, Any]]):
+        now = time.time()
+        with self._conn() as conn:
+            conn.executemany(
+                f"INSERT INTO {self.table} (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(user_id, json.dumps(data), now) for user_id, data in items.items()]
+            )
+
+    def remove(self, user_id: str):
+        with self._conn() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE user_id = ?", (user_id,))
+
+BACKENDS = {
+    "chroma": ChromaBackend,
+    "sqlite": SQLiteBackend,
+    "memory": InMemoryBackend,
+}
+
+# Constructor argument that keeps a namespace's documents apart in each backend
+NAMESPACE_ARGS = {
+    "chroma": "collection",
+    "sqlite": "table",
+}
+
+def make_backend(name: Optional[str] = None, namespace: Optional[str] = None) -> SessionBackend:
+    """Create the backend named by name or the MEMORY_BACKEND setting.
+
+    namespace selects a separate collection/table, e.g. for cohorts.
+    """
+    name = (name or MEMORY_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown MEMORY_BACKEND '{name}', expected one of {sorted(BACKENDS)}")
+    if namespace and name in NAMESPACE_ARGS:
+        return BACKENDS[name](**{NAMESPACE_ARGS[name]: namespace})
+    return BACKENDS[name]()
@@ -0,0 +1,81 @@
+# app/batching.py
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List, Tuple
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class WindowedBatcher:
+    """Coalesces items submitted from many threads into batches.
+
+    The first item opens a window of window_ms; everything submitted before it
+    closes (up to max_batch_size) is handed to process() as one batch. With
+    workers > 1 batches are processed concurrently on a small executor;
+    otherwise in submission order on the collecting thread. Subclasses
+    implement process() and resolve each item's future; if it raises, every
+    unresolved future gets the error.
+    """
+
+    def __init__(self, name: str, window_ms: float, max_batch_size: int, workers: int = 1):
+        self.name = name
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.workers = max(1, workers)
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._worker = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._worker is None:
+                if self.workers > 1:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item; the future resolves once its batch is processed."""
+        future: Future = Future()
+        self._start()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self) -> List[Tuple[Any, Future]]:
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            if self._executor is not None:
+                self._executor.submit(self._send, items)
+            else:
+                self._send(items)
+
+    def _send(self, items: List[Tuple[Any, Future]]):
+        try:
+            self.process(items)
+        except Exception as e:
+            logger.error("%s batch error: %s", self.name, e)
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+    def process(self, items: List[Tuple[Any, Future]]):
+        raise NotImplementedError
+
+    def queued(self) -> int:
+        return self._queue.qsize()
@@ -1,32 +1,184 @@
-import requests
-from app.memory import memory_store
+from app.memory import MemoryStore, memory_store
+from app.cache import LRUCache
+from app.due_index import due_index
 from datetime import datetime, timedelta
 import os
-from dotenv import load_dotenv
+import threading
+import uuid
 import logging
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Load .env
-load_dotenv()
+DEFAULT_COACH_ID = "coach123"
+DEFAULT_INSTRUCTION_ID = "default_123"
+DEFAULT_PROMPT = "Motivate the user to stay consistent."
 
-def fetch_coach_instructions(user_id: str, coach_id: str) -> dict:
-    """Fetch coach instructions directly from ChromaDB."""
-    logger.debug(f"Getting coach instructions for user_id={user_id}, coach_id={coach_id}")
-    
-    session = memory_store.get(user_id) or {}
-    instruction = session.get("coach_instruction", {
-        "instruction_id": "default_123",
+# Parsed flags by instruction_id, for instructions stored without them
+COACH_PARSE_CACHE_SIZE = int(os.getenv("COACH_PARSE_CACHE_SIZE", "4096"))
+parsed_instructions = LRUCache(COACH_PARSE_CACHE_SIZE)
+
+# Users written per batched upsert when broadcasting
+COACH_BROADCAST_BATCH_SIZE = int(os.getenv("COACH_BROADCAST_BATCH_SIZE", "500"))
+
+# Hours a per-user override (from /coach/chat or a targeted broadcast) stays in effect; 0 keeps it until deleted
+COACH_OVERRIDE_TTL_HOURS = float(os.getenv("COACH_OVERRIDE_TTL_HOURS", "0"))
+
+# Coach-wide instructions by coach_id; a user's own coach_instruction overrides them
+coach_store = MemoryStore(namespace="coach_instructions")
+
+# Users assigned to each coach ({"user_ids": [...]}), so coach-wide changes only touch them
+coach_members_store = MemoryStore(namespace="coach_members")
+_members_lock = threading.Lock()
+
+def make_coach_instruction(user_id: str, coach_id: str, prompt: str, instruction_id: str = None,
+                           ttl_hours: float = None) -> dict:
+    """Build an instruction record with its prompt parsed once, up front.
+
+    With ttl_hours the instruction carries an expires_at and stops applying after it.
+    """
+    now = datetime.now()
+    instruction = {
+        "instruction_id": instruction_id or f"coach_{now.timestamp()}",
         "coach_id": coach_id,
         "user_id": user_id,
-        "prompt": "Motivate the user to stay consistent.",
-        "timestamp": datetime.now().isoformat()
-    })
+        "prompt": prompt,
+        "parsed": parse_coach_prompt(prompt),
+        "timestamp": now.isoformat()
+    }
+    if ttl_hours:
+        instruction["expires_at"] = (now + timedelta(hours=ttl_hours)).isoformat()
+    return instruction
+
+def make_override(user_id: str, coach_id: str, prompt: str, instruction_id: str = None) -> dict:
+    """A per-user instruction; it expires after COACH_OVERRIDE_TTL_HOURS, if set."""
+    return make_coach_instruction(user_id, coach_id, prompt, instruction_id, ttl_hours=COACH_OVERRIDE_TTL_HOURS)
+
+def override_active(override: dict, now: datetime = None) -> bool:
+    """An override beats the coach-wide instruction until it is deleted or expires."""
+    expires_at = override.get("expires_at")
+    return not expires_at or datetime.fromisoformat(expires_at) > (now or datetime.now())
+
+def broadcast_instruction(coach_id: str, prompt: str, user_ids: list) -> dict:
+    """Give many users the same instruction, parsed once and written in batched upserts.
+
+    The copies are overrides: they win over the coach-wide instruction until
+    deleted or expired. For every user of a coach, use set_coach_instruction.
+    """
+    targets = list(dict.fromkeys(user_ids))
+    job_id = f"broadcast_{uuid.uuid4().hex[:12]}"
+    instruction = make_override(None, coach_id, prompt, instruction_id=job_id)
+    batches = 0
+    for start in range(0, len(targets), COACH_BROADCAST_BATCH_SIZE):
+        batch = targets[start:start + COACH_BROADCAST_BATCH_SIZE]
+        memory_store.patch_many({
+            user_id: {"coach_instruction": dict(instruction, user_id=user_id)} for user_id in batch
+        })
+        batches += 1
+    logger.info("Broadcast %s from %s written to %s users in %s batches", job_id, coach_id, len(targets), batches)
+    return {
+        "job_id": job_id,
+        "instruction": instruction,
+        "requested": len(user_ids),
+        "updated": len(targets),
+        "duplicates": len(user_ids) - len(targets),
+        "batches": batches
+    }
+
+def set_coach_instruction(coach_id: str, prompt: str) -> dict:
+    """Store one instruction for every user of coach_id; users with an override keep theirs."""
+    from app.tools import refresh_due_many
+    instruction = make_coach_instruction(None, coach_id, prompt)
+    coach_store.set(coach_id, instruction)
+    logger.info("Coach instruction for %s set to %s", coach_id, instruction['instruction_id'])
+    if coach_id == DEFAULT_COACH_ID:
+        # Every unassigned user belongs to the default coach and they aren't listed
+        # anywhere, so re-index on the next tick instead
+        due_index.ready = False
+        return instruction
+    # A warning tone moves reminder times for the members who inherit it
+    members = coach_members(coach_id)
+    for start in range(0, len(members), COACH_BROADCAST_BATCH_SIZE):
+        refresh_due_many(members[start:start + COACH_BROADCAST_BATCH_SIZE])
+    return instruction
+
+def get_coach_instruction(coach_id: str) -> dict:
+    """The coach-wide instruction, or {} if the coach has none."""
+    return coach_store.get(coach_id)
+
+def user_coach_id(session: dict, default: str) -> str:
+    """The coach a user belongs to: assigned coach_id, then their override's coach, then default."""
+    return session.get("coach_id") or (session.get("coach_instruction") or {}).get("coach_id") or default
+
+def coach_members(coach_id: str) -> list:
+    """Users assigned to coach_id with assign_coach."""
+    return list(coach_members_store.get(coach_id).get("user_ids", []))
+
+def assign_coach(coach_id: str, user_ids: list) -> int:
+    """Attach users to coach_id so they inherit its instruction; one batched write per chunk."""
+    targets = list(dict.fromkeys(user_ids))
+    for start in range(0, len(targets), COACH_BROADCAST_BATCH_SIZE):
+        batch = targets[start:start + COACH_BROADCAST_BATCH_SIZE]
+        previous = memory_store.get_many(batch, fields=["coach_id"])
+        memory_store.patch_many({user_id: {"coach_id": coach_id} for user_id in batch})
+        with _members_lock:
+            moved = {}
+            for user_id in batch:
+                old = previous[user_id].get("coach_id")
+                if old and old != coach_id:
+                    moved.setdefault(old, set()).add(user_id)
+            rosters = coach_members_store.get_many([coach_id, *moved])
+            updates = {old: {"user_ids": [u for u in rosters[old].get("user_ids", []) if u not in users]}
+                       for old, users in moved.items()}
+            members = rosters[coach_id].get("user_ids", [])
+            updates[coach_id] = {"user_ids": list(dict.fromkeys(members + batch))}
+            coach_members_store.patch_many(updates)
+    return len(targets)
+
+def fetch_coach_instructions(user_id: str, coach_id: str, session: dict = None) -> dict:
+    """Fetch coach instructions directly from ChromaDB.
+
+    Resolution order: the user's own coach_instruction unless it has expired
+    (see override_active), then the coach-wide instruction of their coach
+    (cached by the coach store), then the default. Pass an already loaded session to avoid
+    reading it again.
+    """
+    logger.debug("Getting coach instructions for user_id=%s, coach_id=%s", user_id, coach_id)
     
-    logger.debug(f"Retrieved coach instruction: {instruction}")
+    if session is None:
+        session = memory_store.get(user_id) or {}
+    override = session.get("coach_instruction")
+    coach_id = user_coach_id(session, coach_id)
+    if override and override_active(override):
+        instruction = override
+    else:
+        instruction = coach_store.get(coach_id) or {
+            "instruction_id": DEFAULT_INSTRUCTION_ID,
+            "coach_id": coach_id,
+            "user_id": user_id,
+            "prompt": DEFAULT_PROMPT,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    logger.debug("Retrieved coach instruction: %s", instruction)
     return instruction
+
+def instruction_flags(instruction: dict) -> dict:
+    """Parsed flags for an instruction: stored with it, else cached by instruction_id."""
+    parsed = instruction.get("parsed")
+    if parsed is not None:
+        return parsed
+    instruction_id = instruction.get("instruction_id")
+    if instruction_id is None:
+        return parse_coach_prompt(instruction.get("prompt", ""))
+    parsed = parsed_instructions.get(instruction_id)
+    if parsed is None:
+        parsed = parse_coach_prompt(instruction.get("prompt", ""))
+        parsed_instructions.set(instruction_id, parsed)
+    return parsed
+
+def coach_flags(user_id: str, coach_id: str, session: dict = None) -> dict:
+    """Parsed coach instruction flags for a user."""
+    return instruction_flags(fetch_coach_instructions(user_id, coach_id, session))
    
 def parse_coach_prompt(prompt: str) -> dict:
     """Parse coach prompt to extract intent and details."""
@@ -44,5 +196,5 @@ def parse_coach_prompt(prompt: str) -> dict:
         result["motivation_type"] = "warning"
         result["warning_tone"] = True
     
-    logger.debug(f"Parsed prompt '{prompt}' to {result}")
+    logger.debug("Parsed prompt '%s' to %s", prompt, result)
     return result
\ No newline at end of file
@@ -0,0 +1,32 @@
+# app/cohorts.py
+from typing import Any, Dict, List, Optional
+from app.memory import MemoryStore
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cohort documents live in their own namespace so they never show up as users
+cohort_store = MemoryStore(namespace="cohorts")
+
+def set_cohort(cohort_id: str, user_ids: List[str], coach_id: Optional[str] = None) -> Dict[str, Any]:
+    """Create or replace a cohort's member list."""
+    cohort = {
+        "cohort_id": cohort_id,
+        "coach_id": coach_id,
+        "user_ids": list(dict.fromkeys(user_ids)),
+        "updated_at": datetime.now().isoformat()
+    }
+    cohort_store.set(cohort_id, cohort)
+    logger.info("Cohort %s set with %s users", cohort_id, len(cohort['user_ids']))
+    return cohort
+
+def get_cohort(cohort_id: str) -> Dict[str, Any]:
+    """Return the cohort document, or {} if it does not exist."""
+    return cohort_store.get(cohort_id)
+
+def cohort_members(cohort_id: str) -> List[str]:
+    return list(get_cohort(cohort_id).get("user_ids", []))
+
+def delete_cohort(cohort_id: str):
+    cohort_store.clear(cohort_id)
@@ -0,0 +1,67 @@
+# app/due_index.py
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import heapq
+import threading
+
+class DueIndex:
+    """Min-heap of users keyed by their next due time.
+
+    Rescheduling pushes a new heap entry and leaves the old one behind; stale
+    entries are skipped when popped and dropped when the heap is compacted.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._due: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.ready = False  # set once the index has been built from the store
+
+    def schedule(self, user_id: str, due_at: Optional[datetime]):
+        """Set the user's next due time; None removes the user."""
+        with self._lock:
+            if due_at is None:
+                self._due.pop(user_id, None)
+                return
+            ts = due_at.timestamp()
+            if self._due.get(user_id) == ts:
+                return
+            self._due[user_id] = ts
+            heapq.heappush(self._heap, (ts, user_id))
+            if len(self._heap) > 2 * len(self._due) + 64:
+                self._compact()
+
+    def remove(self, user_id: str):
+        self.schedule(user_id, None)
+
+    def pop_due(self, now: datetime) -> List[str]:
+        """Remove and return every user due at or before now, earliest first."""
+        cutoff = now.timestamp()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= cutoff:
+                ts, user_id = heapq.heappop(self._heap)
+                if self._due.get(user_id) == ts:
+                    del self._due[user_id]
+                    due.append(user_id)
+        return due
+
+    def next_due(self, user_id: str) -> Optional[datetime]:
+        with self._lock:
+            ts = self._due.get(user_id)
+        return datetime.fromtimestamp(ts) if ts is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+            self._due = {}
+            self.ready = False
+
+    def _compact(self):
+        self._heap = [(ts, user_id) for user_id, ts in self._due.items()]
+        heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+due_index = DueIndex()
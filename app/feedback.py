@@ -0,0 +1,75 @@
+# app/feedback.py
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+from app.batching import WindowedBatcher
+from app.memory import memory_store
+from app.tools import refresh_due_many
+from datetime import datetime
+import asyncio
+import os
+
+FEEDBACK_BATCH_WINDOW_MS = float(os.getenv("FEEDBACK_BATCH_WINDOW_MS", "50"))
+FEEDBACK_BATCH_MAX_SIZE = int(os.getenv("FEEDBACK_BATCH_MAX_SIZE", "500"))
+
+def feedback_fields(feedback: str, completed: bool = True, received_at: datetime = None) -> Dict[str, Any]:
+    """Session fields recorded for one piece of feedback."""
+    return {
+        "feedback": feedback,
+        "feedback_at": (received_at or datetime.now()).isoformat(),
+        "completed": completed
+    }
+
+def record_feedback_many(updates: Dict[str, Dict[str, Any]]) -> int:
+    """Write feedback for many users in batched upserts and clear their pending reminders.
+
+    Returns the number of batches written.
+    """
+    from app.scheduler import cancel_reminder_jobs
+    user_ids = list(updates)
+    batches = 0
+    for start in range(0, len(user_ids), FEEDBACK_BATCH_MAX_SIZE):
+        batch = user_ids[start:start + FEEDBACK_BATCH_MAX_SIZE]
+        memory_store.patch_many({user_id: updates[user_id] for user_id in batch})
+        # With feedback in, only the next exercise is left in each user's due time
+        refresh_due_many(batch)
+        for user_id in batch:
+            cancel_reminder_jobs(user_id)
+        batches += 1
+    return batches
+
+class FeedbackBatcher(WindowedBatcher):
+    """Coalesces single feedback submissions into record_feedback_many calls.
+
+    The first submission opens a window of window_ms; everything that arrives
+    before it closes (up to max_batch_size) is written as one batch. Batches
+    are written one at a time, in order, so later feedback always wins.
+    """
+
+    def __init__(self, window_ms: float = FEEDBACK_BATCH_WINDOW_MS, max_batch_size: int = FEEDBACK_BATCH_MAX_SIZE):
+        super().__init__("feedback-batcher", window_ms, max_batch_size)
+        self.batches = 0
+        self.submissions = 0
+
+    def record(self, user_id: str, fields: Dict[str, Any], timeout: float = None):
+        self.submit((user_id, fields)).result(timeout=timeout)
+
+    async def arecord(self, user_id: str, fields: Dict[str, Any]):
+        await asyncio.wrap_future(self.submit((user_id, fields)))
+
+    def process(self, items: List[Tuple[Tuple[str, Dict[str, Any]], Future]]):
+        # Later feedback from the same user in a window wins
+        record_feedback_many({user_id: fields for (user_id, fields), _ in items})
+        self.batches += 1
+        self.submissions += len(items)
+        for _, future in items:
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "submissions": self.submissions,
+            "average_batch": self.submissions / self.batches if self.batches else 0.0,
+            "queued": self.queued(),
+        }
+
+feedback_batcher = FeedbackBatcher()
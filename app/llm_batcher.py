@@ -0,0 +1,89 @@
+# app/llm_batcher.py
+from concurrent.futures import Future
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.batching import WindowedBatcher
+import asyncio
+import os
+import threading
+
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "20"))
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "16"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_REQUESTS_PER_SECOND = float(os.getenv("LLM_REQUESTS_PER_SECOND", "0"))  # 0 = no limit
+# Batches in flight at once, so one slow batch doesn't hold up the prompts queued behind it
+LLM_BATCH_WORKERS = int(os.getenv("LLM_BATCH_WORKERS", "4"))
+
+class LLMBatcher(WindowedBatcher):
+    """Coalesces prompts submitted from many threads into llm.batch calls.
+
+    The first prompt opens a window of window_ms; everything submitted before
+    it closes (up to max_batch_size) goes out as one batch with at most
+    max_concurrency requests in flight. Up to workers batches are sent at
+    once. With requests_per_second set, each prompt waits for a rate-limiter
+    token before its batch is sent. With a guard (a ResilientCaller), each
+    batch holds one of its concurrency slots per request in flight, so the
+    guard's limit covers batched requests too. Prompts whose caller gave up
+    before their batch went out are dropped.
+    """
+
+    def __init__(self, get_llm: Callable[[], Any], window_ms: float = LLM_BATCH_WINDOW_MS,
+                 max_batch_size: int = LLM_BATCH_MAX_SIZE, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 requests_per_second: float = LLM_REQUESTS_PER_SECOND, workers: int = LLM_BATCH_WORKERS,
+                 guard: Optional[Any] = None):
+        super().__init__("llm-batcher", window_ms, max_batch_size, workers)
+        self.get_llm = get_llm
+        self.guard = guard
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = None
+        if requests_per_second > 0:
+            from langchain_core.rate_limiters import InMemoryRateLimiter
+            self.rate_limiter = InMemoryRateLimiter(
+                requests_per_second=requests_per_second,
+                check_every_n_seconds=0.01,
+                max_bucket_size=max(1, max_concurrency),
+            )
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.prompts = 0
+        self.largest_batch = 0
+
+    def invoke(self, prompt: Any, timeout: float = None) -> Any:
+        return self.submit(prompt).result(timeout=timeout)
+
+    async def ainvoke(self, prompt: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(prompt))
+
+    def process(self, items: List[Tuple[Any, Future]]):
+        items = [(prompt, future) for prompt, future in items if future.set_running_or_notify_cancel()]
+        if not items:
+            return
+        prompts = [prompt for prompt, _ in items]
+        if self.rate_limiter is not None:
+            for _ in prompts:
+                self.rate_limiter.acquire(blocking=True)
+        in_flight = min(len(prompts), self.max_concurrency)
+        with self.guard.slots(in_flight) if self.guard is not None else nullcontext(in_flight) as in_flight:
+            results = self.get_llm().batch(
+                prompts,
+                config={"max_concurrency": in_flight},
+                return_exceptions=True,
+            )
+        with self._stats_lock:
+            self.batches += 1
+            self.prompts += len(prompts)
+            self.largest_batch = max(self.largest_batch, len(prompts))
+        for (_, future), result in zip(items, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "prompts": self.prompts,
+            "largest_batch": self.largest_batch,
+            "average_batch": self.prompts / self.batches if self.batches else 0.0,
+            "queued": self.queued(),
+        }
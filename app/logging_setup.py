@@ -0,0 +1,106 @@
+# app/logging_setup.py
+from logging.handlers import QueueHandler, QueueListener
+from app.metrics import current_trace_id
+from typing import Optional, TextIO
+import atexit
+import json
+import logging
+import os
+import queue
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # text | json
+# Per-logger levels, e.g. "app.agent=DEBUG,chromadb=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(trace_id)s]: %(message)s"
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any extra= fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TraceIdFilter(logging.Filter):
+    """Stamp records with the current request's trace id ("-" outside a request).
+
+    Runs on the caller's side of the queue, where the trace id context is set.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+def parse_levels(spec: str) -> dict:
+    """Parse "name=LEVEL,name=LEVEL" into {name: LEVEL}."""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+_listener: Optional[QueueListener] = None
+_previous_handlers = []
+_previous_level = logging.WARNING
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, levels: str = LOG_LEVELS,
+                      stream: Optional[TextIO] = None) -> QueueListener:
+    """Send all logging through a queue; a listener thread formats and writes it.
+
+    Callers only pay for the level check and message interpolation of records
+    that are enabled; formatting (including JSON) and I/O happen off the
+    request thread. Calling it again replaces the previous configuration.
+    """
+    global _listener, _previous_handlers, _previous_level
+    shutdown_logging()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    _previous_handlers = root.handlers[:]
+    _previous_level = root.level
+    for existing in _previous_handlers:
+        root.removeHandler(existing)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(TraceIdFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, logger_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _listener.start()
+    return _listener
+
+def shutdown_logging():
+    """Flush queued records and restore the root handlers and level that were replaced."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+    for handler in _previous_handlers:
+        root.addHandler(handler)
+    root.setLevel(_previous_level)
+
+atexit.register(shutdown_logging)
@@ -1,16 +1,39 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from app.scheduler import start_scheduler, SINGLE_USER_ID
+from typing import List, Optional
+from app.logging_setup import configure_logging, shutdown_logging
+from app.scheduler import start_scheduler, remove_user, last_tick_metrics, SINGLE_USER_ID
 from app.memory import memory_store
-from app.agent import run_agent, AgentState
+from app.agent import run_agent_async, stream_agent, get_graph, get_llm, llm_batcher, llm_guard, AgentState
+from app.answer_cache import answer_cache
+from app.due_index import due_index
+from app.metrics import (HTTP_SECONDS, registry, stats_collector, new_trace_id,
+                         set_trace_id, reset_trace_id)
+from app.coach import (make_override, broadcast_instruction, fetch_coach_instructions,
+                       set_coach_instruction, get_coach_instruction, assign_coach, DEFAULT_COACH_ID)
+from app.feedback import feedback_batcher, feedback_fields, record_feedback_many
+from app.cohorts import set_cohort, get_cohort, cohort_members
+from app.tools import refresh_due_many, session_status, STATUS_FIELDS
 from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import asyncio
+import json
+import os
+import time
+# Largest page /coach/status serves
+STATUS_PAGE_MAX = int(os.getenv("STATUS_PAGE_MAX", "500"))
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    configure_logging()
+    # Heavy clients are created lazily on import; build them before serving requests
+    get_graph(async_mode=True)  # compile the agent graph once
+    get_llm()
+    memory_store.backend
     start_scheduler()
     yield
+    shutdown_logging()
 app = FastAPI(title="Exercise Coach Agent", version="1.0.0", lifespan=lifespan)
 # Add CORS middleware
 app.add_middleware(
@@ -22,6 +45,34 @@ app.add_middleware(
     expose_headers=["*"],
     max_age=3600,
 )
+# Stats the components already keep, exported on /metrics as gauges
+registry.register_collector(stats_collector("memory_cache", "Session store cache", memory_store.cache_stats))
+registry.register_collector(stats_collector("answer_cache", "Answer cache", answer_cache.stats))
+registry.register_collector(stats_collector("llm_guard", "LLM retry and circuit breaker", llm_guard.stats))
+registry.register_collector(stats_collector("llm_batcher", "LLM request batching", llm_batcher.stats))
+registry.register_collector(stats_collector("feedback_batcher", "Feedback write batching", feedback_batcher.stats))
+registry.register_collector(stats_collector("scheduler_last_tick", "Last scheduler tick", lambda: dict(last_tick_metrics)))
+registry.register_collector(stats_collector("due_index", "Scheduler due index", lambda: {"size": len(due_index)}))
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Tag each request with a trace id (X-Request-ID) and time it by route template.
+
+    Streaming responses are timed up to their first byte.
+    """
+    trace_id = request.headers.get("X-Request-ID") or new_trace_id()
+    token = set_trace_id(trace_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = trace_id
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                             route=route.path if route is not None else "unmatched", status=status)
+        reset_trace_id(token)
 # Explicit OPTIONS handlers
 @app.options("/chat")
 async def options_chat():
@@ -47,71 +98,177 @@ async def options_coach_chat():
     )
 class ChatMessage(BaseModel):
     message: str
+    user_id: str = SINGLE_USER_ID
+    coach_id: str = DEFAULT_COACH_ID
+class FeedbackMessage(BaseModel):
+    feedback: str
+    user_id: str = SINGLE_USER_ID
+    completed: bool = True
+class FeedbackBatch(BaseModel):
+    items: List[FeedbackMessage]
 class CoachMessage(BaseModel):
     user_id: str
     prompt: str
+    coach_id: str = DEFAULT_COACH_ID
+class CoachBroadcast(BaseModel):
+    prompt: str
+    coach_id: str = DEFAULT_COACH_ID
+    user_ids: List[str] = []
+    cohort_id: Optional[str] = None
+class CoachInstruction(BaseModel):
+    prompt: str
+class CoachUsers(BaseModel):
+    user_ids: List[str]
+class Cohort(BaseModel):
+    user_ids: List[str]
+    coach_id: Optional[str] = None
 # main chat endpoint
 @app.post("/chat")
-def chat_with_agent(chat: ChatMessage):
+async def chat_with_agent(chat: ChatMessage):
     """Take input, run agent."""
     state = AgentState(
         input=chat.message,
-        user_id=SINGLE_USER_ID,
-        coach_id="coach123",
+        user_id=chat.user_id,
+        coach_id=chat.coach_id,
         node_output="",
         output=""
     )
-    result = run_agent(state)
+    result = await run_agent_async(state)
     return {"response": result}
+@app.post("/chat/stream")
+async def chat_with_agent_stream(chat: ChatMessage):
+    """Take input, run agent, stream the response as server-sent events."""
+    state = AgentState(
+        input=chat.message,
+        user_id=chat.user_id,
+        coach_id=chat.coach_id,
+        node_output="",
+        output=""
+    )
+    async def events():
+        try:
+            async for chunk in stream_agent(state):
+                yield f"data: {json.dumps(chunk)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+        yield "event: done\ndata: {}\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+# feedback endpoints
+@app.post("/feedback")
+async def submit_feedback(message: FeedbackMessage):
+    """Record a user's feedback on their exercise; concurrent submissions are written together."""
+    fields = feedback_fields(message.feedback, message.completed)
+    await feedback_batcher.arecord(message.user_id, fields)
+    return {"status": "feedback recorded", "user_id": message.user_id, **fields}
+@app.post("/feedback/bulk")
+async def submit_feedback_bulk(batch: FeedbackBatch):
+    """Record many users' feedback with batched writes; a user's last item wins."""
+    received_at = datetime.now()
+    updates = {item.user_id: feedback_fields(item.feedback, item.completed, received_at) for item in batch.items}
+    batches = await asyncio.to_thread(record_feedback_many, updates)
+    return {"status": "feedback recorded", "received": len(batch.items), "users": len(updates), "batches": batches}
 # coach endpoints
 @app.get("/coach-commands")
-def get_coach_commands(user_id: str, coach_id: str):
-    """Get coach instructions from ChromaDB."""
-    user_data = memory_store.get(user_id)
-    instruction = user_data.get("coach_instruction", {
-        "instruction_id": "default_123",
-        "coach_id": coach_id,
-        "user_id": user_id,
-        "prompt": "Motivate the user to stay consistent.",
-        "timestamp": datetime.now().isoformat()
-    })
-    return instruction
+async def get_coach_commands(user_id: str, coach_id: str):
+    """Get the user's effective coach instruction: override, coach-wide or default."""
+    return await asyncio.to_thread(fetch_coach_instructions, user_id, coach_id)
 @app.post("/coach/chat")
-def coach_chat(message: CoachMessage):
-    """Coach sends instruction to user."""
-    instruction = {
-        "instruction_id": f"coach_{datetime.now().timestamp()}",
-        "coach_id": "coach_001",
-        "user_id": message.user_id,
-        "prompt": message.prompt,
-        "timestamp": datetime.now().isoformat()
-    }
-    memory_store.update(message.user_id, {"coach_instruction": instruction})
+async def coach_chat(message: CoachMessage):
+    """Coach sends an instruction to one user; it overrides the coach-wide one until deleted or expired."""
+    instruction = make_override(message.user_id, message.coach_id, message.prompt)
+    await memory_store.aupdate(message.user_id, {"coach_instruction": instruction})
+    # A warning tone moves the user's reminder times
+    await asyncio.to_thread(refresh_due_many, [message.user_id])
     return {"status": "instruction sent", "instruction": instruction}
+@app.put("/coaches/{coach_id}/instruction")
+async def put_coach_instruction(coach_id: str, message: CoachInstruction):
+    """Set the instruction every user of the coach inherits unless they have an override."""
+    instruction = await asyncio.to_thread(set_coach_instruction, coach_id, message.prompt)
+    return {"status": "instruction set", "instruction": instruction}
+@app.get("/coaches/{coach_id}/instruction")
+async def read_coach_instruction(coach_id: str):
+    instruction = await asyncio.to_thread(get_coach_instruction, coach_id)
+    if not instruction:
+        raise HTTPException(status_code=404, detail=f"No instruction for coach '{coach_id}'")
+    return instruction
+@app.post("/coaches/{coach_id}/users")
+async def add_coach_users(coach_id: str, message: CoachUsers):
+    """Assign users to a coach so they inherit the coach's instruction."""
+    assigned = await asyncio.to_thread(assign_coach, coach_id, message.user_ids)
+    await asyncio.to_thread(refresh_due_many, list(dict.fromkeys(message.user_ids)))
+    return {"coach_id": coach_id, "assigned": assigned}
+@app.delete("/coach/overrides/{user_id}")
+async def delete_coach_override(user_id: str):
+    """Drop the user's own instruction so they fall back to their coach's."""
+    await memory_store.apatch(user_id, {"coach_instruction": None})
+    await asyncio.to_thread(refresh_due_many, [user_id])
+    return {"status": "override removed"}
+@app.post("/coach/broadcast")
+async def coach_broadcast(message: CoachBroadcast):
+    """Coach sends one instruction to a list of users and/or a cohort, or to all their users.
+
+    Without user_ids or a cohort_id the instruction is stored once as the coach-wide
+    instruction instead of being copied to every user.
+    """
+    user_ids = list(message.user_ids)
+    if message.cohort_id:
+        members = await asyncio.to_thread(cohort_members, message.cohort_id)
+        if not members:
+            raise HTTPException(status_code=404, detail=f"Unknown or empty cohort '{message.cohort_id}'")
+        user_ids += members
+    if not user_ids:
+        instruction = await asyncio.to_thread(set_coach_instruction, message.coach_id, message.prompt)
+        return {"status": "instruction set", "scope": "coach", "instruction": instruction}
+    result = await asyncio.to_thread(broadcast_instruction, message.coach_id, message.prompt, user_ids)
+    # The instruction can change when warning reminders fall due
+    await asyncio.to_thread(refresh_due_many, list(dict.fromkeys(user_ids)))
+    return {"status": "instruction sent", "scope": "users", **result}
+@app.put("/coach/cohorts/{cohort_id}")
+async def put_cohort(cohort_id: str, cohort: Cohort):
+    """Create or replace a cohort's member list."""
+    return await asyncio.to_thread(set_cohort, cohort_id, cohort.user_ids, cohort.coach_id)
+@app.get("/coach/cohorts/{cohort_id}")
+async def read_cohort(cohort_id: str):
+    cohort = await asyncio.to_thread(get_cohort, cohort_id)
+    if not cohort:
+        raise HTTPException(status_code=404, detail=f"Unknown cohort '{cohort_id}'")
+    return cohort
 @app.get("/status")
-def get_status():
-    session = memory_store.get(SINGLE_USER_ID)
-    if not session:
-        return {"status": "not_scheduled"}
-    
-    if not session.get("last_exercise"):
-        status = "scheduled"
-    elif not session.get("feedback"):
-        status = "waiting_feedback"
-    else:
-        status = "completed"
-    
+async def get_status(user_id: str = SINGLE_USER_ID):
+    session = await memory_store.aget(user_id)
+    return session_status(session)
+@app.get("/coach/status")
+async def get_bulk_status(cohort_id: Optional[str] = None, user_ids: Optional[str] = None,
+                          offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=STATUS_PAGE_MAX)):
+    """Status for a page of a cohort's users and/or a comma-separated user_ids list."""
+    targets = [user_id for user_id in (user_ids or "").split(",") if user_id]
+    if cohort_id:
+        cohort = await asyncio.to_thread(get_cohort, cohort_id)
+        if not cohort:
+            raise HTTPException(status_code=404, detail=f"Unknown cohort '{cohort_id}'")
+        targets += cohort["user_ids"]
+    if not targets:
+        raise HTTPException(status_code=400, detail="Provide user_ids or a cohort_id")
+    targets = list(dict.fromkeys(targets))
+    page = targets[offset:offset + limit]
+    sessions = await memory_store.aget_many(page, fields=STATUS_FIELDS)
+    next_offset = offset + limit if offset + limit < len(targets) else None
     return {
-        "status": status,
-        "scheduled_time": session.get("scheduled_time"),
-        "last_exercise": session.get("last_exercise"),
-        "feedback": session.get("feedback"),
-        "reminders_sent": session.get("reminders_sent", 0)
+        "total": len(targets),
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset,
+        "users": [{"user_id": user_id, **session_status(sessions[user_id])} for user_id in page]
     }
 @app.post("/reset")
-def reset_session():
-    memory_store.clear(SINGLE_USER_ID)
+async def reset_session(user_id: str = SINGLE_USER_ID):
+    await memory_store.aclear(user_id)
+    await asyncio.to_thread(remove_user, user_id)
     return {"message": "Session reset"}
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 @app.get("/")
-def root():
+async def root():
     return {"message": "Exercise Coach Agent - Send messages to /chat"}
\ No newline at end of file
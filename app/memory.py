@@ -1,39 +1,455 @@
-import chromadb
-from typing import Dict, Any
-import json
+from typing import Dict, Any, Iterable, List, Optional
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from app.backends import SessionBackend, make_backend
+from app.cache import LRUCache
+from app.metrics import STORE_ERRORS, STORE_SECONDS
+import asyncio
+import atexit
+import contextvars
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Cache settings (MEMORY_CACHE_SIZE=0 disables the cache)
+MEMORY_CACHE_SIZE = int(os.getenv("MEMORY_CACHE_SIZE", "1024"))
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", "300"))
+MEMORY_WRITE_BACK = os.getenv("MEMORY_WRITE_BACK", "false").lower() in ("1", "true", "yes")
+MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", "5"))
+MEMORY_FLUSH_THRESHOLD = int(os.getenv("MEMORY_FLUSH_THRESHOLD", "100"))
+
+# Number of per-user locks; users hash onto a stripe
+MEMORY_LOCK_STRIPES = int(os.getenv("MEMORY_LOCK_STRIPES", "64"))
+
+# Session snapshot for the agent run executing in the current context
+_active_session = contextvars.ContextVar("active_session", default=None)
+
+class SessionSnapshot:
+    """One user's document, loaded once and written back once per agent run.
+
+    Field writes and increments are recorded so the flush merges them into the
+    current stored document instead of overwriting writes made by other threads.
+    """
+
+    def __init__(self, store: "MemoryStore", user_id: str, data: Dict[str, Any]):
+        self.store = store
+        self.user_id = user_id
+        self.data = data
+        self.changes: Dict[str, Any] = {}
+        self.deltas: Dict[str, int] = {}
+        self.replaced = False
+
+    @property
+    def dirty(self) -> bool:
+        return self.replaced or bool(self.changes) or bool(self.deltas)
+
+    def patch(self, fields: Dict[str, Any]):
+        self.data.update(fields)
+        self.changes.update(fields)
+        for field in fields:
+            self.deltas.pop(field, None)
+
+    def increment(self, field: str, amount: int) -> int:
+        value = (self.data.get(field) or 0) + amount
+        self.data[field] = value
+        if field in self.changes:
+            self.changes[field] = value
+        else:
+            self.deltas[field] = self.deltas.get(field, 0) + amount
+        return value
+
+    def replace(self, data: Dict[str, Any]):
+        self.data = dict(data)
+        self.changes = {}
+        self.deltas = {}
+        self.replaced = True
+
+    def flush(self):
+        if not self.dirty:
+            return
+        with self.store._lock_for(self.user_id):
+            data = dict(self.data) if self.replaced else self.store._load(self.user_id, fresh=True)
+            if not self.replaced:
+                data.update(self.changes)
+                for field, amount in self.deltas.items():
+                    data[field] = (data.get(field) or 0) + amount
+            if data:
+                self.store._save(self.user_id, data)
+            else:
+                self.store._delete(self.user_id)
+        self.changes = {}
+        self.deltas = {}
+        self.replaced = False
 
 class MemoryStore:
-    def __init__(self):
-        self.client = chromadb.Client()
-        self.collection = self.client.get_or_create_collection("user_data")
+    """User documents in a SessionBackend behind an LRU cache with optional write-back.
 
-    def get(self, user_id: str) -> Dict[str, Any]:
+    With write_back enabled, writes update the cache and a pending-writes map;
+    pending documents are upserted in one batch every flush_interval seconds,
+    once flush_threshold users are pending, and at exit.
+    """
+
+    def __init__(self, backend: Optional[SessionBackend] = None, namespace: Optional[str] = None,
+                 cache_size: int = MEMORY_CACHE_SIZE, cache_ttl: float = MEMORY_CACHE_TTL,
+                 write_back: bool = MEMORY_WRITE_BACK, flush_interval: float = MEMORY_FLUSH_INTERVAL,
+                 flush_threshold: int = MEMORY_FLUSH_THRESHOLD):
+        self._backend = backend
+        self.namespace = namespace
+        self._backend_lock = threading.Lock()
+        self.cache = LRUCache(cache_size, cache_ttl or None) if cache_size > 0 else None
+        self.write_back = write_back
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._dirty_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._stripes = [threading.RLock() for _ in range(max(1, MEMORY_LOCK_STRIPES))]
+        if self.write_back:
+            atexit.register(self.flush)
+
+    @property
+    def backend(self) -> SessionBackend:
+        """The storage backend, created on first use so importing the app opens no connections."""
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = make_backend(namespace=self.namespace)
+        return self._backend
+
+    def _timed(self, op: str, call, *args):
+        """Run one backend call, recording its latency and any error by op."""
+        start = time.perf_counter()
         try:
-            results = self.collection.get(ids=[user_id])
-            if results['documents'] and results['documents'][0]:
-                return json.loads(results['documents'][0])
-            return {}
-        except:
+            return call(*args)
+        except Exception:
+            STORE_ERRORS.inc(op=op)
+            raise
+        finally:
+            STORE_SECONDS.observe(time.perf_counter() - start, op=op)
+
+    def _read(self, user_id: str) -> Dict[str, Any]:
+        try:
+            return self._timed("read", self.backend.read, user_id)
+        except Exception as e:
+            logger.error("memory read error for %s: %s", user_id, e)
             return {}
 
-    def set(self, user_id: str, data: Dict[str, Any]):
+    def _write(self, items: Dict[str, Dict[str, Any]]):
+        try:
+            self._timed("write", self.backend.write, items)
+        except Exception as e:
+            logger.error("memory write error for %s: %s", list(items), e)
+            raise
+
+    def _remove(self, user_id: str):
+        try:
+            self._timed("remove", self.backend.remove, user_id)
+        except Exception as e:
+            logger.error("memory delete error for %s: %s", user_id, e)
+
+    def _load(self, user_id: str, fresh: bool = False) -> Dict[str, Any]:
+        """Return the user's document; fresh skips the cache for read-modify-write paths.
+
+        Another process sharing the backend may have written since the document
+        was cached, so a merge must start from the stored copy (or this process's
+        own pending write).
+        """
+        data = self.cache.get(user_id) if self.cache is not None and not fresh else None
+        if data is None:
+            # Fill under the user's stripe so a read racing a write can't cache the older document
+            with self._lock_for(user_id):
+                with self._dirty_lock:
+                    data = self._dirty.get(user_id)
+                if data is None:
+                    data = self._read(user_id)
+                if self.cache is not None:
+                    self.cache.set(user_id, data)
+        return dict(data)
+
+    def _load_many(self, user_ids: List[str], fields: Optional[Iterable[str]] = None,
+                   fresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        missing = []
+        for user_id in user_ids:
+            data = self.cache.get(user_id) if self.cache is not None and not fresh else None
+            if data is None:
+                with self._dirty_lock:
+                    data = self._dirty.get(user_id)
+            if data is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = data
+        if missing:
+            with self._locked(missing):
+                with self._dirty_lock:
+                    pending = {user_id: self._dirty[user_id] for user_id in missing if user_id in self._dirty}
+                to_read = [user_id for user_id in missing if user_id not in pending]
+                fetched = {}
+                if to_read:
+                    try:
+                        fetched = self._timed("read_many", self.backend.read_many, to_read)
+                    except Exception as e:
+                        logger.error("memory batch read error: %s", e)
+                for user_id in missing:
+                    data = pending[user_id] if user_id in pending else fetched.get(user_id, {})
+                    if self.cache is not None:
+                        self.cache.set(user_id, data)
+                    found[user_id] = data
+        if fields is not None:
+            return {user_id: {field: found[user_id][field] for field in fields if field in found[user_id]}
+                    for user_id in user_ids}
+        return {user_id: dict(found[user_id]) for user_id in user_ids}
+
+    def _save(self, user_id: str, data: Dict[str, Any]):
+        data = dict(data)
+        if not self.write_back:
+            self._write_through({user_id: data})
+            return
+        if self.cache is not None:
+            self.cache.set(user_id, data)
+        with self._dirty_lock:
+            self._dirty[user_id] = data
+            pending = len(self._dirty)
+        self._start_flusher()
+        if pending >= self.flush_threshold:
+            self._flush_pending()
+
+    def _save_many(self, items: Dict[str, Dict[str, Any]]):
+        items = {user_id: dict(data) for user_id, data in items.items()}
+        if not self.write_back:
+            self._write_through(items)
+            return
+        if self.cache is not None:
+            for user_id, data in items.items():
+                self.cache.set(user_id, data)
+        with self._dirty_lock:
+            self._dirty.update(items)
+            pending = len(self._dirty)
+        self._start_flusher()
+        if pending >= self.flush_threshold:
+            self._flush_pending()
+
+    def _write_through(self, items: Dict[str, Dict[str, Any]]):
+        """Write to the backend, then the cache, so a failed write never leaves unsaved data cached."""
+        try:
+            self._write(items)
+        except Exception:
+            if self.cache is not None:
+                for user_id in items:
+                    self.cache.pop(user_id)
+            raise
+        if self.cache is not None:
+            for user_id, data in items.items():
+                self.cache.set(user_id, data)
+
+    def _flush_pending(self):
+        # The caller's write is safely pending either way; a failed batch is retried by the next flush
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("memory flush error, %s documents kept for retry: %s", len(self._dirty), e)
+
+    def _delete(self, user_id: str):
+        with self._flush_lock:
+            if self.cache is not None:
+                self.cache.pop(user_id)
+            with self._dirty_lock:
+                self._dirty.pop(user_id, None)
+            self._remove(user_id)
+
+    def _start_flusher(self):
+        with self._dirty_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="memory-flush", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("memory flush error: %s", e)
+
+    def flush(self):
+        """Write all pending documents to the backend in one batch.
+
+        If the write fails the batch stays pending and the error is raised;
+        the next flush retries it.
+        """
+        with self._flush_lock:
+            with self._dirty_lock:
+                items = dict(self._dirty)
+            if not items:
+                return
+            self._write(items)
+            with self._dirty_lock:
+                for user_id, data in items.items():
+                    # Keep entries rewritten while the batch was in flight
+                    if self._dirty.get(user_id) is data:
+                        del self._dirty[user_id]
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Cache counters plus the number of documents waiting to be written."""
+        stats = self.cache.stats() if self.cache is not None else {}
+        stats["pending_writes"] = len(self._dirty)
+        return stats
+
+    def _lock_for(self, user_id: str) -> threading.RLock:
+        return self._stripes[hash(user_id) % len(self._stripes)]
+
+    @contextmanager
+    def _locked(self, user_ids: Iterable[str]):
+        """Hold the stripes of all user_ids, each taken once in a fixed order so batches can't deadlock."""
+        stripes = sorted({id(lock): lock for lock in map(self._lock_for, user_ids)}.items())
+        with ExitStack() as stack:
+            for _, lock in stripes:
+                stack.enter_context(lock)
+            yield
+
+    def _snapshot(self, user_id: str) -> Optional[SessionSnapshot]:
+        snapshot = _active_session.get()
+        if snapshot is not None and snapshot.store is self and snapshot.user_id == user_id:
+            return snapshot
+        return None
+
+    @contextmanager
+    def session(self, user_id: str):
+        """Serve reads and collect writes for user_id in memory, flushing once on exit."""
+        snapshot = self._snapshot(user_id)
+        if snapshot is not None:
+            yield snapshot
+            return
+        snapshot = SessionSnapshot(self, user_id, self._load(user_id))
+        token = _active_session.set(snapshot)
+        try:
+            yield snapshot
+        finally:
+            _active_session.reset(token)
+            snapshot.flush()
+
+    @asynccontextmanager
+    async def asession(self, user_id: str):
+        """Async session(): the load and the flush run in a worker thread."""
+        snapshot = self._snapshot(user_id)
+        if snapshot is not None:
+            yield snapshot
+            return
+        snapshot = SessionSnapshot(self, user_id, await asyncio.to_thread(self._load, user_id))
+        token = _active_session.set(snapshot)
+        try:
+            yield snapshot
+        finally:
+            _active_session.reset(token)
+            await asyncio.to_thread(snapshot.flush)
+
+    def get(self, user_id: str) -> Dict[str, Any]:
+        snapshot = self._snapshot(user_id)
+        if snapshot is not None:
+            return dict(snapshot.data)
+        return self._load(user_id)
+
+    def get_many(self, user_ids: Iterable[str], fields: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Return {user_id: document} for user_ids with one backend read for cache misses.
+
+        With fields, each document is cut down to just those keys.
+        """
+        return self._load_many(list(user_ids), list(fields) if fields is not None else None)
+
+    def user_ids(self) -> List[str]:
+        """Return every known user_id, including documents still waiting to be written."""
         try:
-            self.collection.upsert(
-                ids=[user_id],
-                documents=[json.dumps(data)]
-            )
-        except:
-            pass
+            ids = self._timed("ids", self.backend.ids)
+        except Exception as e:
+            logger.error("memory id listing error: %s", e)
+            ids = []
+        known = set(ids)
+        with self._dirty_lock:
+            pending = [user_id for user_id in self._dirty if user_id not in known]
+        return ids + pending
+
+    def set(self, user_id: str, data: Dict[str, Any]):
+        snapshot = self._snapshot(user_id)
+        if snapshot is not None:
+            snapshot.replace(data)
+            return
+        with self._lock_for(user_id):
+            self._save(user_id, data)
+
+    def patch(self, user_id: str, fields: Dict[str, Any]):
+        """Atomically merge fields into the user's document."""
+        snapshot = self._snapshot(user_id)
+        if snapshot is not None:
+            snapshot.patch(fields)
+            return
+        with self._lock_for(user_id):
+            existing = self._load(user_id, fresh=True)
+            existing.update(fields)
+            self._save(user_id, existing)
+
+    def patch_many(self, updates: Dict[str, Dict[str, Any]]):
+        """Merge fields into many documents with one batch read and one batch write."""
+        updates = dict(updates)
+        for user_id in list(updates):
+            snapshot = self._snapshot(user_id)
+            if snapshot is not None:
+                snapshot.patch(updates.pop(user_id))
+        if not updates:
+            return
+        with self._locked(updates):
+            documents = self._load_many(list(updates), fresh=True)
+            for user_id, fields in updates.items():
+                documents[user_id].update(fields)
+            self._save_many(documents)
+
+    def increment(self, user_id: str, field: str, amount: int = 1) -> int:
+        """Atomically add amount to a numeric field and return the new value."""
+        snapshot = self._snapshot(user_id)
+        if snapshot is not None:
+            return snapshot.increment(field, amount)
+        with self._lock_for(user_id):
+            existing = self._load(user_id, fresh=True)
+            existing[field] = (existing.get(field) or 0) + amount
+            self._save(user_id, existing)
+            return existing[field]
 
     def update(self, user_id: str, data: Dict[str, Any]):
-        existing = self.get(user_id)
-        existing.update(data)
-        self.set(user_id, existing)
+        self.patch(user_id, data)
 
     def clear(self, user_id: str):
-        try:
-            self.collection.delete(ids=[user_id])
-        except:
-            pass
+        snapshot = self._snapshot(user_id)
+        if snapshot is not None:
+            snapshot.replace({})
+            return
+        with self._lock_for(user_id):
+            self._delete(user_id)
+
+    # Async variants for the event loop; backend I/O runs in a worker thread
+    async def aget(self, user_id: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.get, user_id)
+
+    async def aget_many(self, user_ids: Iterable[str], fields: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        return await asyncio.to_thread(self.get_many, list(user_ids), fields)
+
+    async def aset(self, user_id: str, data: Dict[str, Any]):
+        await asyncio.to_thread(self.set, user_id, data)
+
+    async def apatch(self, user_id: str, fields: Dict[str, Any]):
+        await asyncio.to_thread(self.patch, user_id, fields)
+
+    async def aupdate(self, user_id: str, data: Dict[str, Any]):
+        await asyncio.to_thread(self.update, user_id, data)
+
+    async def apatch_many(self, updates: Dict[str, Dict[str, Any]]):
+        await asyncio.to_thread(self.patch_many, updates)
+
+    async def aincrement(self, user_id: str, field: str, amount: int = 1) -> int:
+        return await asyncio.to_thread(self.increment, user_id, field, amount)
+
+    async def aclear(self, user_id: str):
+        await asyncio.to_thread(self.clear, user_id)
 
-memory_store = MemoryStore()
\ No newline at end of file
+memory_store = MemoryStore()
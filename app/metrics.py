@@ -0,0 +1,229 @@
+# app/metrics.py
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import contextvars
+import functools
+import inspect
+import threading
+import time
+import uuid
+
+# Latency buckets in seconds, from a cache hit to a slow LLM call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Trace id of the request being handled in the current context
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+def set_trace_id(trace_id: str) -> contextvars.Token:
+    return _trace_id.set(trace_id)
+
+def reset_trace_id(token: contextvars.Token):
+    _trace_id.reset(token)
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Iterable[Tuple[str, Any]]) -> str:
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return f"{{{pairs}}}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+class Histogram:
+    """Cumulative-bucket latency histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(labels.get(name, "") for name in self.labelnames))
+        return series[-1] if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        lines = []
+        for key, series in sorted(snapshot.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, hits in zip(self.buckets, series):
+                cumulative += hits
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(float(series[-2]))}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+# A collector returns [(name, kind, help, [(labels dict, value), ...]), ...]
+Collector = Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]]
+
+class Registry:
+    """Named metrics plus collectors for stats kept elsewhere, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help: str, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, tuple(labelnames), **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}"
+                             for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+NODE_SECONDS = registry.histogram(
+    "agent_node_duration_seconds", "Time spent in each LangGraph node", ["node"])
+ROUTE_SECONDS = registry.histogram(
+    "agent_route_duration_seconds", "Time spent choosing the next node")
+ROUTES = registry.counter(
+    "agent_routes_total", "Routing decisions by target node", ["target"])
+STORE_SECONDS = registry.histogram(
+    "store_operation_duration_seconds", "Storage backend call latency", ["op"])
+STORE_ERRORS = registry.counter(
+    "store_operation_errors_total", "Storage backend calls that raised", ["op"])
+LLM_SECONDS = registry.histogram(
+    "llm_call_duration_seconds", "LLM call latency including retries", ["mode", "outcome"])
+HTTP_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"])
+
+def timed_node(name: str, node: Callable) -> Callable:
+    """Wrap a graph node (sync or async) so its run time lands in NODE_SECONDS."""
+    if inspect.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def timed_async(state):
+            start = time.perf_counter()
+            try:
+                return await node(state)
+            finally:
+                NODE_SECONDS.observe(time.perf_counter() - start, node=name)
+        return timed_async
+
+    @functools.wraps(node)
+    def timed(state):
+        start = time.perf_counter()
+        try:
+            return node(state)
+        finally:
+            NODE_SECONDS.observe(time.perf_counter() - start, node=name)
+    return timed
+
+def timed_router(router: Callable) -> Callable:
+    """Wrap a conditional-edge function to time it and count where it routes."""
+    @functools.wraps(router)
+    def timed(state):
+        start = time.perf_counter()
+        target = router(state)
+        ROUTE_SECONDS.observe(time.perf_counter() - start)
+        ROUTES.inc(target=target)
+        return target
+    return timed
+
+def stats_collector(prefix: str, help: str, get_stats: Callable[[], Dict[str, Any]]) -> Collector:
+    """Expose a component's stats() dict as gauges named <prefix>_<key>.
+
+    Strings become a gauge of 1 with the text in a "value" label; other
+    non-numeric entries are skipped.
+    """
+    def collect():
+        samples = []
+        for key, value in get_stats().items():
+            name = f"{prefix}_{key}"
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                samples.append((name, "gauge", f"{help}: {key}", [({}, value)]))
+            elif isinstance(value, str):
+                samples.append((name, "gauge", f"{help}: {key}", [({"value": value}, 1)]))
+        return samples
+    return collect
@@ -0,0 +1,240 @@
+# app/resilience.py
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+LLM_CONCURRENCY_LIMIT = int(os.getenv("LLM_CONCURRENCY_LIMIT", "8"))
+LLM_ACQUIRE_TIMEOUT = float(os.getenv("LLM_ACQUIRE_TIMEOUT", "5"))
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+# Per-attempt provider timeout, and the budget for one call including the slot wait and every retry
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "30"))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the breaker is open."""
+
+class SaturatedError(Exception):
+    """Raised when no concurrency slot frees up within the acquire timeout."""
+
+def is_transient(error: Exception) -> bool:
+    """Timeouts, connection errors, rate limits and 5xx responses are worth retrying."""
+    import openai
+    transient = (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                 openai.InternalServerError, TimeoutError, ConnectionError)
+    return isinstance(error, transient)
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures and lets one trial call
+    through (half-open) once reset_seconds have passed."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release_trial(self):
+        """Give back a half-open trial slot that was never used."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logger.error("LLM circuit breaker opened after %s failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+class ResilientCaller:
+    """Runs provider calls behind a concurrency limit, jittered retries and a circuit breaker.
+
+    Every call has an overall deadline: no retry starts once it would begin
+    past the deadline, and async attempts are cancelled when it expires. A sync
+    attempt cannot be cancelled, so it can overrun by at most the client's own
+    request timeout.
+
+    The limit counts provider requests. A call whose fn only queues the prompt
+    for a batcher passes hold_slot=False, and the batcher takes slots() for the
+    requests it actually sends.
+    """
+
+    def __init__(self, breaker: CircuitBreaker = None, limit: int = LLM_CONCURRENCY_LIMIT,
+                 acquire_timeout: float = LLM_ACQUIRE_TIMEOUT, attempts: int = LLM_RETRY_ATTEMPTS,
+                 base_delay: float = LLM_RETRY_BASE_DELAY, max_delay: float = LLM_RETRY_MAX_DELAY,
+                 deadline: float = LLM_CALL_DEADLINE):
+        self.breaker = breaker or CircuitBreaker()
+        self.limit = limit
+        self.acquire_timeout = acquire_timeout
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._reserve_lock = threading.Lock()
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        self.metrics = {"calls": 0, "successes": 0, "failures": 0, "retries": 0,
+                        "rejected_open": 0, "rejected_saturated": 0, "deadline_exceeded": 0}
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _before_call(self):
+        self.metrics["calls"] += 1
+        if not self.breaker.allow():
+            self.metrics["rejected_open"] += 1
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline: float) -> Optional[float]:
+        """Backoff before the next attempt, or None to give up and raise the error."""
+        if is_transient(error) and attempt < self.attempts - 1:
+            delay = self._backoff(attempt)
+            if time.monotonic() + delay < deadline:
+                self.metrics["retries"] += 1
+                return delay
+            self.metrics["deadline_exceeded"] += 1
+        self.metrics["failures"] += 1
+        if is_transient(error):
+            self.breaker.record_failure()
+        else:
+            # Not a provider outage; don't count it against the breaker
+            self.breaker.release_trial()
+        return None
+
+    @contextmanager
+    def slots(self, count: int):
+        """Hold count concurrency slots (capped at the limit) for one batch of provider requests."""
+        count = max(1, min(count, self.limit))
+        timeout = time.monotonic() + self.acquire_timeout
+        acquired = 0
+        # One reservation at a time, so two batches can't each hold part of what they need
+        with self._reserve_lock:
+            while acquired < count:
+                if not self._semaphore.acquire(timeout=max(0.0, timeout - time.monotonic())):
+                    for _ in range(acquired):
+                        self._semaphore.release()
+                    self.metrics["rejected_saturated"] += 1
+                    raise SaturatedError("Too many LLM calls in flight")
+                acquired += 1
+        try:
+            yield count
+        finally:
+            for _ in range(count):
+                self._semaphore.release()
+
+    def call(self, fn: Callable[[], Any], hold_slot: bool = True) -> Any:
+        deadline = time.monotonic() + self.deadline
+        self._before_call()
+        if not hold_slot:
+            return self._attempts(fn, deadline)
+        if not self._semaphore.acquire(timeout=min(self.acquire_timeout, self.deadline)):
+            self.metrics["rejected_saturated"] += 1
+            self.breaker.release_trial()
+            raise SaturatedError("Too many LLM calls in flight")
+        try:
+            return self._attempts(fn, deadline)
+        finally:
+            self._semaphore.release()
+
+    def _attempts(self, fn: Callable[[], Any], deadline: float) -> Any:
+        for attempt in range(self.attempts):
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.metrics["successes"] += 1
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], hold_slot: bool = True) -> Any:
+        deadline = time.monotonic() + self.deadline
+        self._before_call()
+        if not hold_slot:
+            return await self._aattempts(fn, deadline)
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.setdefault(loop, asyncio.Semaphore(self.limit))
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=min(self.acquire_timeout, self.deadline))
+        except asyncio.TimeoutError:
+            self.metrics["rejected_saturated"] += 1
+            self.breaker.release_trial()
+            raise SaturatedError("Too many LLM calls in flight")
+        except asyncio.CancelledError:
+            self.breaker.release_trial()
+            raise
+        try:
+            return await self._aattempts(fn, deadline)
+        finally:
+            semaphore.release()
+
+    async def _aattempts(self, fn: Callable[[], Awaitable[Any]], deadline: float) -> Any:
+        try:
+            for attempt in range(self.attempts):
+                try:
+                    result = await asyncio.wait_for(fn(), timeout=max(0.0, deadline - time.monotonic()))
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, deadline)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    continue
+                self.metrics["successes"] += 1
+                self.breaker.record_success()
+                return result
+        except asyncio.CancelledError:
+            # The caller went away (e.g. a /chat/stream client disconnected); a cancelled
+            # half-open trial must hand its slot back or the breaker never lets a call through
+            self.breaker.release_trial()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.metrics, breaker_state=self.breaker.state,
+                    breaker_opened=self.breaker.times_opened,
+                    consecutive_failures=self.breaker.failures)
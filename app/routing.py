@@ -1,20 +1,80 @@
 # app/routing.py
+from typing import Dict, List, Optional, Sequence, Tuple
 from app.tools import should_send_exercise, should_send_reminder
 from app.memory import memory_store
+import re
+
+# Explicit intents in priority order: the highest-priority intent with a
+# whole-word match wins. Keywords are words or phrases, split into words the
+# same way messages are, so punctuation and extra spaces between words are ignored.
+# A trailing "*" on a keyword's first word matches any word starting with it.
+INTENT_TABLE: List[Tuple[str, Sequence[str]]] = [
+    ("schedule", ["schedul*", "reschedul*"]),
+    ("question", ["how", "what", "why"]),
+    ("check_feedback", ["check feedback"]),
+    ("send_exercise", ["send exercise"]),
+]
+
+_WORD = re.compile(r"\w+")
+
+class IntentClassifier:
+    """Keyword table compiled into a word -> phrases index.
+
+    A message is lowercased and split into words once; each word is a dict
+    lookup, plus one per distinct prefix length, so classifying is linear in
+    message length whatever the size of the table, and nothing is compiled
+    per call.
+    """
+
+    def __init__(self, table: Sequence[Tuple[str, Sequence[str]]]):
+        self.intents = [intent for intent, _ in table]
+        self._phrases: Dict[str, List[Tuple[Tuple[str, ...], int]]] = {}
+        self._prefixes: Dict[str, List[Tuple[Tuple[str, ...], int]]] = {}
+        for index, (intent, keywords) in enumerate(table):
+            for keyword in keywords:
+                keyword = keyword.lower()
+                words = _WORD.findall(keyword)
+                if not words:
+                    continue
+                prefix = keyword.lstrip().startswith(words[0] + "*")
+                target = self._prefixes if prefix else self._phrases
+                target.setdefault(words[0], []).append((tuple(words[1:]), index))
+        self._prefix_lengths = sorted({len(stem) for stem in self._prefixes})
+
+    def _entries(self, word: str) -> List[Tuple[Tuple[str, ...], int]]:
+        entries = self._phrases.get(word, [])
+        for length in self._prefix_lengths:
+            if length > len(word):
+                break
+            entries = entries + self._prefixes.get(word[:length], [])
+        return entries
+
+    def classify(self, text: str) -> Optional[str]:
+        words = _WORD.findall(text.lower())
+        best = None
+        for position, word in enumerate(words):
+            for rest, index in self._entries(word):
+                if best is not None and index >= best:
+                    continue
+                if not rest or tuple(words[position + 1:position + 1 + len(rest)]) == rest:
+                    best = index
+            if best == 0:
+                break
+        return self.intents[best] if best is not None else None
+
+intent_classifier = IntentClassifier(INTENT_TABLE)
+
+def configure_intents(table: Sequence[Tuple[str, Sequence[str]]]):
+    """Replace the intent table and recompile the classifier."""
+    global intent_classifier
+    intent_classifier = IntentClassifier(table)
 
 def route_input(user_input: str, user_id: str) -> str:
     """Enhanced routing that considers time and user state."""
-    user_input = user_input.lower()
-    
     # Handle explicit user requests first
-    if "schedule" in user_input:
-        return "schedule"
-    elif "how" in user_input or "what" in user_input or "why" in user_input:
-        return "question"
-    elif "check feedback" in user_input:
-        return "check_feedback"
-    elif "send exercise" in user_input:
-        return "send_exercise"
+    intent = intent_classifier.classify(user_input)
+    if intent:
+        return intent
     
     # For automatic hourly runs (empty input), use time-based logic
     if not user_input and user_id:
@@ -1,55 +1,281 @@
-from apscheduler.schedulers.background import BackgroundScheduler
+from concurrent.futures import ThreadPoolExecutor
 from app.memory import memory_store
-from datetime import datetime
+from app.due_index import due_index
+from app.coach import user_coach_id, DEFAULT_COACH_ID
+from app.tools import exercise_due, reminder_due, next_due_at, refresh_due
+from datetime import datetime, timedelta
+import logging
+import os
+import time
 
-scheduler = BackgroundScheduler()
+logger = logging.getLogger(__name__)
 
-# Single user ID - could be from env or config
+# APScheduler instance, created by get_scheduler() when the scheduler starts
+scheduler = None
+
+def get_scheduler():
+    """Return the background scheduler, importing APScheduler on first use."""
+    global scheduler
+    if scheduler is None:
+        from apscheduler.schedulers.background import BackgroundScheduler
+        scheduler = BackgroundScheduler()
+    return scheduler
+
+# User for requests that don't name one (the original single-user setup)
 SINGLE_USER_ID = "user123"
 
-def hourly_agent_run():
-    """Run agent for the single user every hour."""
-    print(f"Running hourly check at {datetime.now()}")
-    
+# Only one process should run the scheduler; set SCHEDULER_ENABLED=false on the other API workers.
+# In event mode those workers still add and remove jobs in the shared job store, they just never run them.
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Tick tuning: users loaded per batch read and agent runs in parallel
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "500"))
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "8"))
+
+# "poll" runs an hourly tick over the due index; "event" gives every user
+# their own cron job plus one-shot reminder jobs in a persistent job store
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "poll").lower()
+SCHEDULER_JOBSTORE_URL = os.getenv("SCHEDULER_JOBSTORE_URL", "sqlite:///jobs.sqlite")
+# How often the running scheduler re-reads the job store, to pick up jobs other processes added
+SCHEDULER_JOBSTORE_POLL_SECONDS = float(os.getenv("SCHEDULER_JOBSTORE_POLL_SECONDS", "60"))
+
+# Reminders go out this many hours after the exercise
+REMINDER_HOURS = (2, 4, 6)
+
+# Metrics for the most recent tick
+last_tick_metrics = {}
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def user_is_due(user_id: str, session: dict, now: datetime) -> bool:
+    """Check whether a user has an exercise or reminder due."""
+    return exercise_due(session, now) or reminder_due(user_id, session, now)
+
+def run_user(user_id: str, session: dict = None) -> str:
+    """Run the agent for one user with empty input, as a scheduled tick."""
     # Import here to avoid circular imports
     from app.agent import run_agent, AgentState
-    
+
+    session = session if session is not None else memory_store.get(user_id)
+    coach_id = user_coach_id(session, DEFAULT_COACH_ID)
+    state = AgentState(
+        input="",
+        user_id=user_id,
+        coach_id=coach_id,
+        node_output="",
+        output=""
+    )
+    return run_agent(state)
+
+def _run_user_safe(item) -> bool:
+    user_id, session = item
     try:
-        print(f"Checking user {SINGLE_USER_ID}")
-        state = AgentState(
-            input="",
-            user_id=SINGLE_USER_ID,
-            coach_id="coach123", 
-            node_output="",
-            output=""
-        )
-        result = run_agent(state)
-        print(f"Result: {result}")
+        result = run_user(user_id, session)
+        logger.debug("Result for %s: %s", user_id, result, extra={"user_id": user_id})
+        return True
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("Error for %s: %s", user_id, e, extra={"user_id": user_id})
+        return False
+
+def rebuild_due_index():
+    """Load every user once, in batches, and index their next due time."""
+    now = datetime.now()
+    due_index.clear()
+    user_ids = memory_store.user_ids()
+    for batch in _batches(user_ids, SCHEDULER_BATCH_SIZE):
+        sessions = memory_store.get_many(batch)
+        for user_id in batch:
+            due_index.schedule(user_id, next_due_at(user_id, sessions[user_id], now))
+    due_index.ready = True
+    logger.info("Due index built: %s of %s users have upcoming work", len(due_index), len(user_ids))
+
+def hourly_agent_run():
+    """Run the agent for every user whose indexed due time has passed, through a worker pool."""
+    started = time.perf_counter()
+    now = datetime.now()
+    logger.info("Running hourly check at %s", now)
+    if not due_index.ready:
+        rebuild_due_index()
+
+    checked = acted = failed = 0
+    popped = due_index.pop_due(now)
+    with ThreadPoolExecutor(max_workers=SCHEDULER_WORKERS, thread_name_prefix="agent-tick") as pool:
+        for batch in _batches(popped, SCHEDULER_BATCH_SIZE):
+            sessions = memory_store.get_many(batch)
+            checked += len(batch)
+            due = [(user_id, sessions[user_id]) for user_id in batch
+                   if user_is_due(user_id, sessions[user_id], now)]
+            for ok in pool.map(_run_user_safe, due):
+                acted += 1
+                failed += 0 if ok else 1
+            # Runs refresh their own entry; this re-indexes users that were popped but not acted on
+            for user_id in batch:
+                if due_index.next_due(user_id) is None:
+                    refresh_due(user_id)
+
+    last_tick_metrics.update({
+        "started_at": now.isoformat(),
+        "users_scanned": checked,
+        "users_acted_on": acted,
+        "errors": failed,
+        "users_indexed": len(due_index),
+        "duration_seconds": round(time.perf_counter() - started, 3),
+    })
+    logger.info("Tick finished: %s", last_tick_metrics, extra={"tick": dict(last_tick_metrics)})
+    return dict(last_tick_metrics)
+
+def run_scheduled_user(user_id: str):
+    """Job entry point for event mode: run the agent if the user still has due work."""
+    session = memory_store.get(user_id)
+    if user_is_due(user_id, session, datetime.now()):
+        _run_user_safe((user_id, session))
+
+def wake_scheduler():
+    """No-op job; waking the scheduler makes it re-read the job store for jobs added elsewhere."""
+
+def exercise_job_id(user_id: str) -> str:
+    return f"exercise:{user_id}"
+
+def reminder_job_id(user_id: str, number: int) -> str:
+    return f"reminder:{user_id}:{number}"
+
+def _event_mode() -> bool:
+    return SCHEDULER_MODE == "event" and scheduler is not None and scheduler.running
+
+def register_exercise_job(user_id: str, hour: int, minute: int):
+    """Create or replace the user's daily exercise job (event mode only)."""
+    if not _event_mode():
+        return
+    scheduler.add_job(
+        "app.scheduler:run_scheduled_user",
+        'cron',
+        hour=hour,
+        minute=minute,
+        args=[user_id],
+        id=exercise_job_id(user_id),
+        replace_existing=True,
+        misfire_grace_time=1800,
+        coalesce=True
+    )
+
+def schedule_reminder_jobs(user_id: str, sent_at: datetime, reminders_sent: int = 0):
+    """Create one-shot jobs for the reminders still to come after sent_at (event mode only)."""
+    if not _event_mode():
+        return
+    now = datetime.now()
+    for number, hours in enumerate(REMINDER_HOURS, start=1):
+        run_at = sent_at + timedelta(hours=hours)
+        if number <= reminders_sent or run_at < now:
+            continue
+        scheduler.add_job(
+            "app.scheduler:run_scheduled_user",
+            'date',
+            run_date=run_at,
+            args=[user_id],
+            id=reminder_job_id(user_id, number),
+            replace_existing=True,
+            misfire_grace_time=1800
+        )
+
+def cancel_reminder_jobs(user_id: str):
+    """Remove any pending reminder jobs for the user (event mode only)."""
+    if not _event_mode():
+        return
+    from apscheduler.jobstores.base import JobLookupError
+    for number in range(1, len(REMINDER_HOURS) + 1):
+        try:
+            scheduler.remove_job(reminder_job_id(user_id, number))
+        except JobLookupError:
+            pass
+
+def sync_user_jobs():
+    """Register jobs for every stored user, e.g. after switching to event mode."""
+    user_ids = memory_store.user_ids()
+    for batch in _batches(user_ids, SCHEDULER_BATCH_SIZE):
+        sessions = memory_store.get_many(batch)
+        for user_id in batch:
+            session = sessions[user_id]
+            if session.get("scheduled_hour") is not None:
+                register_exercise_job(user_id, session["scheduled_hour"], session.get("scheduled_minute", 0))
+            if session.get("exercise_sent_at") and session.get("last_exercise") and not session.get("feedback"):
+                schedule_reminder_jobs(user_id, datetime.fromisoformat(session["exercise_sent_at"]),
+                                       session.get("reminders_sent", 0))
+    logger.info("Scheduler jobs synced for %s users", len(user_ids))
 
 def start_scheduler():
-    """Start the hourly scheduler."""
+    """Start the scheduler in the configured mode.
+
+    In event mode a process with SCHEDULER_ENABLED=false starts the scheduler
+    paused: schedule changes it handles are written to the shared job store,
+    and the one running scheduler executes them.
+    """
+    if SCHEDULER_MODE == "event":
+        # Imported here: the SQLAlchemy job store is only needed in event mode
+        from apscheduler.jobstores.memory import MemoryJobStore
+        from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+        scheduler = get_scheduler()
+        scheduler.configure(jobstores={"default": SQLAlchemyJobStore(url=SCHEDULER_JOBSTORE_URL),
+                                       "local": MemoryJobStore()})
+        if not SCHEDULER_ENABLED:
+            scheduler.start(paused=True)
+            logger.info("Scheduler paused in this process (SCHEDULER_ENABLED=false) - "
+                        "writing per-user jobs to %s", SCHEDULER_JOBSTORE_URL)
+            return
+        scheduler.add_job(
+            wake_scheduler,
+            'interval',
+            seconds=SCHEDULER_JOBSTORE_POLL_SECONDS,
+            id='jobstore_poll',
+            jobstore='local',
+            coalesce=True
+        )
+        scheduler.start()
+        sync_user_jobs()
+        logger.info("Scheduler started - per-user jobs in event mode")
+        return
+    if not SCHEDULER_ENABLED:
+        logger.info("Scheduler disabled in this process (SCHEDULER_ENABLED=false)")
+        return
+    scheduler = get_scheduler()
     scheduler.add_job(
         hourly_agent_run,
         'interval',
         hours=1,
-        id='hourly_agent'
+        id='hourly_agent',
+        max_instances=1,
+        coalesce=True
     )
+    rebuild_due_index()
     scheduler.start()
-    print("Scheduler started - agent will run every hour for single user")
+    logger.info("Scheduler started - agent will run every hour for users with due work")
 
-def set_user_schedule(time_str: str):
-    """Set schedule for the single user."""
+def set_user_schedule(user_id: str, time_str: str):
+    """Set a user's daily exercise time."""
     hour, minute = map(int, time_str.split(":"))
-    memory_store.update(SINGLE_USER_ID, {
+    memory_store.update(user_id, {
         "scheduled_hour": hour,
         "scheduled_minute": minute,
         "scheduled_time": time_str
     })
-    print(f"User scheduled for {time_str}")
+    refresh_due(user_id)
+    register_exercise_job(user_id, hour, minute)
+    logger.info("User %s scheduled for %s", user_id, time_str, extra={"user_id": user_id})
+
+def remove_user(user_id: str):
+    """Drop the user's due-index entry and any jobs, e.g. after their data is reset."""
+    due_index.remove(user_id)
+    if not _event_mode():
+        return
+    cancel_reminder_jobs(user_id)
+    from apscheduler.jobstores.base import JobLookupError
+    try:
+        scheduler.remove_job(exercise_job_id(user_id))
+    except JobLookupError:
+        pass
 
 def schedule_session_fn(user_id: str, time_str: str) -> str:
     """Schedule a workout session (used by agent)."""
-    set_user_schedule(time_str)
-    return f"Scheduled for {time_str} daily"
\ No newline at end of file
+    set_user_schedule(user_id, time_str)
+    return f"Scheduled for {time_str} daily"
@@ -2,6 +2,7 @@ import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 from app.memory import memory_store
+from app.answer_cache import answer_cache
 from app.scheduler import SINGLE_USER_ID
 from datetime import datetime, timedelta
 
@@ -11,6 +12,7 @@ client = TestClient(app)
 def clear_memory():
     """Clear memory before and after each test."""
     memory_store.clear(SINGLE_USER_ID)
+    answer_cache.clear()
     yield
     memory_store.clear(SINGLE_USER_ID)
 
@@ -55,6 +57,129 @@ def test_coach_chat_endpoint():
     assert response.status_code == 200
     assert response.json()["status"] == "instruction sent"
 
+def test_coach_instruction_parsed_once(monkeypatch):
+    """Test instructions are parsed when written and agent runs reuse the stored flags."""
+    from app import coach
+    from app.agent import run_agent, AgentState
+    response = client.post("/coach/chat", json={
+        "user_id": SINGLE_USER_ID,
+        "prompt": "Warn them about lack of exercise and mention their goals"
+    })
+    parsed = response.json()["instruction"]["parsed"]
+    assert parsed["warning_tone"] and parsed["include_goals"]
+
+    calls = []
+    monkeypatch.setattr(coach, "parse_coach_prompt", lambda prompt: calls.append(prompt))
+    memory_store.update(SINGLE_USER_ID, {"last_exercise": "Do 10 squats", "feedback": None,
+                                         "last_exercise_date": (datetime.now() - timedelta(days=4)).date().isoformat()})
+    output = run_agent(AgentState(input="", user_id=SINGLE_USER_ID, coach_id="coach123", node_output="", output=""))
+    assert calls == []
+    assert "haven't exercised in over 3 days" in output
+    assert memory_store.get(SINGLE_USER_ID)["reminders_sent"] == 1
+
+def test_coach_broadcast_to_users_and_cohort():
+    """Test one broadcast reaches listed users and cohort members once each."""
+    from app.coach import coach_store
+    users = ["bulk_a", "bulk_b", "bulk_c"]
+    try:
+        assert client.put("/coach/cohorts/bulk_cohort", json={"user_ids": users[1:]}).status_code == 200
+        response = client.post("/coach/broadcast", json={
+            "prompt": "Remind them of their goals",
+            "user_ids": users[:2],
+            "cohort_id": "bulk_cohort"
+        })
+        assert response.status_code == 200
+        result = response.json()
+        assert (result["requested"], result["updated"], result["duplicates"]) == (4, 3, 1)
+        for user_id in users:
+            instruction = memory_store.get(user_id)["coach_instruction"]
+            assert instruction["instruction_id"] == result["job_id"]
+            assert instruction["user_id"] == user_id
+            assert instruction["parsed"]["include_goals"]
+            assert "expires_at" not in instruction
+        coach_wide = client.post("/coach/broadcast", json={"prompt": "hi", "coach_id": "broadcast_coach"}).json()
+        assert coach_wide["scope"] == "coach"
+        assert coach_store.get("broadcast_coach")["prompt"] == "hi"
+        assert client.post("/coach/broadcast", json={"prompt": "hi", "cohort_id": "nope"}).status_code == 404
+    finally:
+        from app.cohorts import delete_cohort
+        delete_cohort("bulk_cohort")
+        coach_store.clear("broadcast_coach")
+        for user_id in users:
+            memory_store.clear(user_id)
+
+def test_coach_instruction_inherited_with_overrides():
+    """Test users inherit their coach's instruction unless they have a live override of their own."""
+    from app.coach import (coach_members, coach_members_store, coach_store, fetch_coach_instructions,
+                           make_coach_instruction, override_active)
+    from app.due_index import due_index
+    try:
+        assert client.put("/coaches/inherit_coach/instruction",
+                          json={"prompt": "Warn about lack of exercise"}).status_code == 200
+        assert client.post("/coaches/inherit_coach/users",
+                           json={"user_ids": ["inherit_a", "inherit_b"]}).json()["assigned"] == 2
+        client.post("/coach/chat", json={"user_id": "inherit_b", "prompt": "Mention their goals"})
+
+        inherited = fetch_coach_instructions("inherit_a", "coach123")
+        assert inherited["coach_id"] == "inherit_coach"
+        assert inherited["parsed"]["warning_tone"]
+        assert "coach_instruction" not in memory_store.get("inherit_a")
+        assert fetch_coach_instructions("inherit_b", "coach123")["parsed"]["include_goals"]
+
+        assert client.delete("/coach/overrides/inherit_b").status_code == 200
+        assert fetch_coach_instructions("inherit_b", "coach123")["coach_id"] == "inherit_coach"
+
+        # An override outlives newer coach-wide instructions; the change refreshes only the coach's users
+        client.post("/coach/chat", json={"user_id": "inherit_b", "prompt": "Mention their goals"})
+        assert coach_members("inherit_coach") == ["inherit_a", "inherit_b"]
+        due_index.ready = True
+        client.put("/coaches/inherit_coach/instruction", json={"prompt": "Keep it light"})
+        assert due_index.ready
+        assert fetch_coach_instructions("inherit_b", "coach123")["prompt"] == "Mention their goals"
+        assert fetch_coach_instructions("inherit_a", "coach123")["prompt"] == "Keep it light"
+        assert not override_active({"expires_at": "2020-01-02T00:00:00"})
+        assert override_active(make_coach_instruction("inherit_b", "inherit_coach", "hi", ttl_hours=1))
+        assert override_active({"timestamp": "2020-01-01T00:00:00"})
+        assert client.get("/coaches/missing_coach/instruction").status_code == 404
+    finally:
+        coach_store.clear("inherit_coach")
+        coach_members_store.clear("inherit_coach")
+        memory_store.clear("inherit_a")
+        memory_store.clear("inherit_b")
+
+def test_bulk_status_paginates_with_one_read(monkeypatch):
+    """Test bulk status pages through users with one projected batch read per page."""
+    users = ["status_a", "status_b", "status_c"]
+    memory_store.patch_many({
+        "status_a": {"scheduled_time": "09:00", "goals": "x" * 1000},
+        "status_b": {"scheduled_time": "10:00", "last_exercise": "Do 10 squats", "reminders_sent": 2},
+    })
+    reads = []
+    original = memory_store.get_many
+    monkeypatch.setattr(memory_store, "get_many",
+                        lambda ids, fields=None: reads.append(fields) or original(ids, fields))
+    try:
+        first = client.get("/coach/status", params={"user_ids": ",".join(users), "limit": 2}).json()
+        assert (first["total"], first["next_offset"]) == (3, 2)
+        assert [user["status"] for user in first["users"]] == ["scheduled", "waiting_feedback"]
+        assert first["users"][1]["reminders_sent"] == 2
+        second = client.get("/coach/status", params={"user_ids": ",".join(users), "offset": 2}).json()
+        assert second["users"] == [{"user_id": "status_c", "status": "not_scheduled"}]
+        assert second["next_offset"] is None
+        assert len(reads) == 2 and "goals" not in reads[0]
+        assert client.get("/coach/status").status_code == 400
+    finally:
+        for user_id in users:
+            memory_store.clear(user_id)
+
+def test_legacy_instruction_parse_cached_by_id():
+    """Test instructions stored without flags are parsed once per instruction_id."""
+    from app.coach import instruction_flags, parsed_instructions
+    parsed_instructions.clear()
+    legacy = {"instruction_id": "legacy_1", "prompt": "Remind them of their goals"}
+    assert instruction_flags(legacy)["include_goals"]
+    assert instruction_flags(dict(legacy, prompt="changed")) is instruction_flags(legacy)
+
 def test_memory_works():
     """Test ChromaDB memory works."""
     memory_store.set("test_user", {"test": "data"})
@@ -82,6 +207,58 @@ def test_schedule_workout_via_chat():
     session = memory_store.get(SINGLE_USER_ID)
     assert session.get("scheduled_time") == time_str
 
+def test_chat_status_and_reset_are_per_user():
+    """Test /chat, /status and /reset act on the user named in the request."""
+    from app.due_index import due_index
+    try:
+        client.post("/chat", json={"message": "Schedule my workout for 07:15", "user_id": "tenant_a",
+                                   "coach_id": "coach_a"})
+        response = client.post("/chat", json={"message": "Schedule my workout for 18:45", "user_id": "tenant_b"})
+        assert "18:45" in response.json()["response"]
+        assert memory_store.get("tenant_a")["scheduled_time"] == "07:15"
+        assert memory_store.get("tenant_b")["scheduled_time"] == "18:45"
+        assert client.get("/status", params={"user_id": "tenant_a"}).json()["scheduled_time"] == "07:15"
+
+        assert client.post("/reset", params={"user_id": "tenant_a"}).status_code == 200
+        assert memory_store.get("tenant_a") == {}
+        assert due_index.next_due("tenant_a") is None
+        assert memory_store.get("tenant_b")["scheduled_time"] == "18:45"
+    finally:
+        memory_store.clear("tenant_a")
+        memory_store.clear("tenant_b")
+
+def test_feedback_endpoints_stop_reminders():
+    """Test single and bulk feedback are stored and end the reminder cycle."""
+    from app.due_index import due_index
+    from app.tools import reminder_due, refresh_due_many
+    users = ["fb_a", "fb_b", "fb_c"]
+    sent_at = (datetime.now() - timedelta(hours=3)).isoformat()
+    memory_store.patch_many({user_id: {"last_exercise": "Do 10 squats", "feedback": None,
+                                       "reminders_sent": 0, "exercise_sent_at": sent_at} for user_id in users})
+    refresh_due_many(users)
+    try:
+        assert due_index.next_due("fb_a") is not None
+        response = client.post("/feedback", json={"user_id": "fb_a", "feedback": "Done, easy"})
+        assert response.status_code == 200
+        response = client.post("/feedback/bulk", json={"items": [
+            {"user_id": "fb_b", "feedback": "Too hard", "completed": False},
+            {"user_id": "fb_c", "feedback": "first"},
+            {"user_id": "fb_c", "feedback": "Done"},
+        ]})
+        assert (response.json()["received"], response.json()["users"]) == (3, 2)
+
+        sessions = memory_store.get_many(users)
+        assert sessions["fb_a"]["feedback"] == "Done, easy" and sessions["fb_a"]["feedback_at"]
+        assert sessions["fb_b"]["completed"] is False
+        assert sessions["fb_c"]["feedback"] == "Done"
+        for user_id in users:
+            assert not reminder_due(user_id, sessions[user_id])
+            assert due_index.next_due(user_id) is None
+    finally:
+        for user_id in users:
+            memory_store.clear(user_id)
+            due_index.remove(user_id)
+
 def test_reminder_logic():
     """Test reminder logic works."""
     from app.tools import should_send_exercise, should_send_reminder
@@ -129,4 +306,137 @@ def test_chromadb_connection():
     print(f"After clear: {result}")
     
     assert result == {}
-    print("=== ChromaDB Connection Test PASSED ===")
\ No newline at end of file
+    print("=== ChromaDB Connection Test PASSED ===")
+
+def test_import_is_lazy():
+    """Test importing the app builds no LLM client, store connection or scheduler."""
+    import os
+    import subprocess
+    import sys
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    lazy = ["chromadb", "langchain_openai", "langgraph.graph", "apscheduler.schedulers"]
+    probe = f"import sys, app.main; print([m for m in {lazy!r} if m in sys.modules])"
+    env = {key: value for key, value in os.environ.items() if key != "OPENROUTER_API_KEY"}
+    result = subprocess.run([sys.executable, "-c", probe], cwd=root, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+def test_graph_is_compiled_once():
+    """Test the compiled graph is reused until node registration changes."""
+    from app.agent import NODES, get_graph, reset_graph
+
+    graph = get_graph()
+    assert get_graph() is graph
+
+    original = NODES["finalize"]
+    NODES["finalize"] = lambda state: {"output": "replaced"}
+    try:
+        assert get_graph() is not graph
+    finally:
+        NODES["finalize"] = original
+        reset_graph()
+
+
+def test_agent_run_reads_and_writes_store_once(monkeypatch):
+    """Test one agent run loads the session once and flushes it once, merging into a fresh read."""
+    from app.agent import run_agent, AgentState
+
+    stored = {}
+    calls = {"load": 0, "save": 0}
+
+    def fake_read(user_id):
+        calls["load"] += 1
+        return dict(stored)
+
+    def fake_write(items):
+        calls["save"] += 1
+        stored.update(items[SINGLE_USER_ID])
+
+    monkeypatch.setattr(memory_store.backend, "read", fake_read)
+    monkeypatch.setattr(memory_store.backend, "write", fake_write)
+
+    state = AgentState(input="Schedule my workout for 10:00", user_id=SINGLE_USER_ID,
+                       coach_id="coach123", node_output="", output="")
+    run_agent(state)
+
+    # The flush re-reads the stored document so writes from other processes aren't overwritten
+    assert calls == {"load": 2, "save": 1}
+    assert stored["scheduled_time"] == "10:00"
+
+
+def test_each_turn_runs_router_one_action_then_finalize(monkeypatch):
+    """Test a turn runs router, exactly one action node and finalize, with no exercise sent first."""
+    import app.agent as agent
+
+    monkeypatch.setattr(agent, "call_llm", lambda prompt: type("Response", (), {"content": "Keep your core tight."})())
+
+    def node_path(message):
+        state = agent.AgentState(input=message, user_id=SINGLE_USER_ID, coach_id="coach123",
+                                 node_output="", output="")
+        return [node for update in agent.get_graph().stream(state, stream_mode="updates") for node in update]
+
+    assert node_path("How do I hold a plank?") == ["router", "answer_workout_question", "finalize"]
+    assert "last_exercise" not in memory_store.get(SINGLE_USER_ID)
+    assert node_path("Schedule my workout for 10:00") == ["router", "schedule", "finalize"]
+    assert node_path("") == ["router", "send_exercise", "finalize"]
+    # Exercise just sent, reminder not due yet
+    assert node_path("") == ["router", "check_feedback", "finalize"]
+
+def test_async_agent_answers_through_the_batcher(monkeypatch):
+    """Test the non-streaming async path sends its question through the LLM batcher."""
+    import asyncio
+    import app.agent as agent
+
+    batched = []
+
+    class FakeLLM:
+        def batch(self, prompts, config=None, return_exceptions=False):
+            batched.extend(prompts)
+            return [type("Response", (), {"content": "Hold the plank with a straight back."})() for _ in prompts]
+
+        async def ainvoke(self, prompt):
+            raise AssertionError("unbatched ainvoke used outside streaming")
+
+    monkeypatch.setattr(agent, "llm", FakeLLM())
+    state = agent.AgentState(input="How do I hold a plank?", user_id=SINGLE_USER_ID,
+                             coach_id="coach123", node_output="", output="")
+    output = asyncio.run(agent.run_agent_async(state))
+    assert "Hold the plank" in output
+    assert "myagents.ai" in output
+    assert batched == ["Answer this workout question: How do I hold a plank?"]
+
+
+def test_chat_stream_endpoint(monkeypatch):
+    """Test the streaming endpoint sends LLM tokens as events and ends with the footer."""
+    import itertools
+    import json
+    import app.agent as agent
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+
+    monkeypatch.setattr(agent, "llm", GenericFakeChatModel(
+        messages=itertools.cycle([AIMessage(content="Keep your back straight.")])))
+    response = client.post("/chat/stream", json={"message": "How do I hold a plank?"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    chunks = [json.loads(line[len("data: "):]) for line in response.text.splitlines()
+              if line.startswith("data: ") and line != "data: {}"]
+    assert len(chunks) > 2
+    text = "".join(chunks)
+    assert text.startswith("Keep your back straight.")
+    assert text.rstrip().endswith("myagents.ai/signup?ref=coach123")
+    assert "event: done" in response.text
+
+
+def test_question_falls_back_while_breaker_open(monkeypatch):
+    """Test an open breaker answers with the canned fallback without calling the LLM."""
+    import app.agent as agent
+    from app.resilience import CircuitBreaker, ResilientCaller
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    monkeypatch.setattr(agent, "llm_guard", ResilientCaller(breaker))
+    result = agent.answer_workout_question_node({"input": "What is a burpee?", "user_id": "u1"})
+    assert result == {"node_output": agent.FALLBACK_ANSWER}
+    assert agent.llm_guard.stats()["rejected_open"] == 1
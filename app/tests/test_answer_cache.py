@@ -0,0 +1,62 @@
+import pytest
+from app.answer_cache import answer_cache
+
+@pytest.fixture(autouse=True)
+def clear_answer_cache():
+    """Start each test with an empty shared answer cache."""
+    answer_cache.clear()
+    yield
+    answer_cache.clear()
+
+def test_repeat_question_served_from_answer_cache(monkeypatch):
+    """Test a near-identical question reuses the cached answer instead of calling the LLM."""
+    import app.agent as agent
+
+    calls = []
+
+    class FakeLLM:
+        def batch(self, prompts, config=None, return_exceptions=False):
+            calls.extend(prompts)
+            return [type("Response", (), {"content": "Start with 3 sets of 10."})() for _ in prompts]
+
+    monkeypatch.setattr(agent, "llm", FakeLLM())
+    first = agent.answer_workout_question_node({"input": "How many push-ups should I do?", "user_id": "u1"})
+    second = agent.answer_workout_question_node({"input": "  how many PUSH-UPS should I do  ", "user_id": "u1"})
+    assert first == second == {"node_output": "Start with 3 sets of 10."}
+    assert len(calls) == 1
+    assert answer_cache.stats()["exact_hits"] >= 1
+
+def test_answer_cache_semantic_tier():
+    """Test the semantic tier returns the answer of a close question and not of a distant one."""
+    from chromadb.api.types import EmbeddingFunction
+    from app.answer_cache import AnswerCache
+
+    class KeywordEmbedding(EmbeddingFunction):
+        """Toy embedding: one dimension per keyword."""
+        KEYWORDS = ["plank", "push", "squat", "hold", "long"]
+
+        def __init__(self):
+            pass
+
+        def __call__(self, input):
+            return [[float(word in text) + 0.01 for word in self.KEYWORDS] for text in input]
+
+        @staticmethod
+        def name():
+            return "keyword-test"
+
+        def get_config(self):
+            return {}
+
+        @staticmethod
+        def build_from_config(config):
+            return KeywordEmbedding()
+
+    cache = AnswerCache(semantic=True, embedding_function=KeywordEmbedding(),
+                        collection_name="answer_cache_test", max_distance=0.05)
+    cache.set("How long should I hold a plank?", "30 to 60 seconds.")
+
+    assert cache.get("how long to hold plank") == "30 to 60 seconds."
+    assert cache.get("how many squats") is None
+    stats = cache.stats()
+    assert (stats["semantic_hits"], stats["misses"]) == (1, 1)
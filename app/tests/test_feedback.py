@@ -0,0 +1,12 @@
+from concurrent.futures import ThreadPoolExecutor
+from app import feedback
+
+def test_feedback_batcher_coalesces_submissions(monkeypatch):
+    """Test concurrent single submissions are written as one batch."""
+    batches = []
+    monkeypatch.setattr(feedback, "record_feedback_many", lambda updates: batches.append(dict(updates)))
+    batcher = feedback.FeedbackBatcher(window_ms=200)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda n: batcher.record(f"burst_{n}", {"feedback": "done"}, timeout=5), range(8)))
+    assert len(batches) <= 2
+    assert sum(len(batch) for batch in batches) == 8
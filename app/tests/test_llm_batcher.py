@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+from app.llm_batcher import LLMBatcher
+from app.resilience import CircuitBreaker, ResilientCaller
+
+def test_llm_batcher_coalesces_concurrent_prompts():
+    """Test prompts submitted together go out in shared batches with their own results."""
+    batch_sizes = []
+
+    class FakeLLM:
+        def batch(self, prompts, config=None, return_exceptions=False):
+            batch_sizes.append(len(prompts))
+            assert config["max_concurrency"] == min(2, len(prompts))
+            return [f"answer to {prompt}" for prompt in prompts]
+
+    batcher = LLMBatcher(lambda: FakeLLM(), window_ms=100, max_batch_size=8, max_concurrency=2)
+    results = {}
+
+    def ask(n):
+        results[n] = batcher.invoke(f"q{n}", timeout=5)
+
+    threads = [threading.Thread(target=ask, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {n: f"answer to q{n}" for n in range(8)}
+    assert sum(batch_sizes) == 8
+    assert len(batch_sizes) < 8
+
+def test_llm_batcher_slow_batch_does_not_block_the_next():
+    """Test a batch still waiting on the provider doesn't hold up prompts queued after it."""
+    release = threading.Event()
+
+    class FakeLLM:
+        def batch(self, prompts, config=None, return_exceptions=False):
+            if "slow" in prompts:
+                release.wait(5)
+            return [f"answer to {prompt}" for prompt in prompts]
+
+    batcher = LLMBatcher(lambda: FakeLLM(), window_ms=10, max_batch_size=8, workers=2)
+    slow = batcher.submit("slow")
+    time.sleep(0.05)  # let the slow batch go out on its own
+    assert batcher.invoke("fast", timeout=2) == "answer to fast"
+    assert not slow.done()
+    release.set()
+    assert slow.result(timeout=2) == "answer to slow"
+
+def test_llm_batcher_guard_limits_requests_not_waiting_callers():
+    """Test callers waiting on a batch hold no guard slot, so a batch can outgrow the limit it sends under."""
+    guard = ResilientCaller(CircuitBreaker(), limit=2)
+    sent = []
+
+    class FakeLLM:
+        def batch(self, prompts, config=None, return_exceptions=False):
+            sent.append((len(prompts), config["max_concurrency"]))
+            return [f"answer to {prompt}" for prompt in prompts]
+
+    batcher = LLMBatcher(lambda: FakeLLM(), window_ms=100, max_batch_size=8, max_concurrency=4, guard=guard)
+
+    async def main():
+        return await asyncio.gather(*(guard.acall(lambda n=n: batcher.ainvoke(f"q{n}"), hold_slot=False)
+                                      for n in range(8)))
+
+    assert asyncio.run(main()) == [f"answer to q{n}" for n in range(8)]
+    assert sum(size for size, _ in sent) == 8
+    assert max(size for size, _ in sent) > 2
+    assert all(concurrency <= 2 for _, concurrency in sent)
@@ -0,0 +1,39 @@
+import io
+import json
+import logging
+from app.logging_setup import configure_logging, shutdown_logging, parse_levels
+
+class CountingRepr:
+    """Counts how often it is turned into text."""
+    calls = 0
+
+    def __str__(self):
+        CountingRepr.calls += 1
+        return "state"
+
+def test_queue_logging_writes_json_with_extra_fields():
+    """Test records go through the queue listener as JSON including extra= fields."""
+    stream = io.StringIO()
+    configure_logging(level="INFO", fmt="json", stream=stream)
+    try:
+        logging.getLogger("app.test").info("Tick finished for %s", "user1", extra={"user_id": "user1"})
+    finally:
+        shutdown_logging()
+    entry = json.loads(stream.getvalue().strip())
+    assert entry["message"] == "Tick finished for user1"
+    assert (entry["level"], entry["logger"], entry["user_id"]) == ("INFO", "app.test", "user1")
+
+def test_disabled_levels_are_never_formatted():
+    """Test debug records below the configured level cost no formatting, and overrides apply."""
+    stream = io.StringIO()
+    configure_logging(level="INFO", fmt="text", levels="app.noisy=DEBUG", stream=stream)
+    try:
+        CountingRepr.calls = 0
+        logging.getLogger("app.quiet").debug("Routing state: %s", CountingRepr())
+        logging.getLogger("app.noisy").debug("Routing state: %s", CountingRepr())
+    finally:
+        shutdown_logging()
+        logging.getLogger("app.noisy").setLevel(logging.NOTSET)
+    assert CountingRepr.calls == 1
+    assert stream.getvalue().count("Routing state") == 1
+    assert parse_levels("a=debug, b=WARNING,bad") == {"a": "DEBUG", "b": "WARNING"}
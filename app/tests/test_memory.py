@@ -0,0 +1,188 @@
+import pytest
+import time
+from app.backends import ChromaBackend, InMemoryBackend, SQLiteBackend
+from app.cache import LRUCache
+from app.memory import MemoryStore
+
+def test_lru_cache_evicts_least_recently_used():
+    """Test the cache drops the oldest entry and counts hits, misses and evictions."""
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (3, 1, 1)
+
+def test_lru_cache_expires_entries():
+    """Test entries older than the TTL are treated as misses."""
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"] == 1
+
+def test_write_back_batches_dirty_documents(monkeypatch):
+    """Test write-back serves reads from cache and flushes pending writes in one batch."""
+    store = MemoryStore(InMemoryBackend(), cache_size=10, write_back=True,
+                        flush_interval=3600, flush_threshold=3)
+    batches = []
+    monkeypatch.setattr(store.backend, "write", lambda items: batches.append(dict(items)))
+
+    store.update("u1", {"reminders_sent": 1})
+    store.update("u2", {"reminders_sent": 2})
+    assert batches == []
+    assert store.get("u1") == {"reminders_sent": 1}
+    assert store.cache_stats()["pending_writes"] == 2
+
+    store.update("u3", {"reminders_sent": 3})
+    assert len(batches) == 1
+    assert set(batches[0]) == {"u1", "u2", "u3"}
+    assert store.cache_stats()["pending_writes"] == 0
+
+def test_failed_flush_keeps_batch_for_retry(monkeypatch):
+    """Test a write-back batch the backend rejects stays pending and lands on the next flush."""
+    backend = InMemoryBackend()
+    store = MemoryStore(backend, cache_size=10, write_back=True, flush_interval=3600, flush_threshold=2)
+    original_write = backend.write
+    failures = [ConnectionError("backend down")]
+
+    def flaky_write(items):
+        if failures:
+            raise failures.pop()
+        original_write(items)
+
+    monkeypatch.setattr(backend, "write", flaky_write)
+    store.update("u1", {"reminders_sent": 1})
+    store.update("u2", {"reminders_sent": 2})  # threshold flush fails; the caller is not affected
+    assert store.cache_stats()["pending_writes"] == 2
+    assert backend.read("u1") == {}
+
+    store.flush()
+    assert store.cache_stats()["pending_writes"] == 0
+    assert backend.read("u2") == {"reminders_sent": 2}
+
+@pytest.fixture(params=["memory", "sqlite", "chroma"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryBackend()
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "sessions.db"))
+    return ChromaBackend(path=str(tmp_path / "chroma"))
+
+def test_backend_round_trip(backend):
+    """Test every backend stores, replaces and deletes user documents."""
+    assert backend.read("u1") == {}
+    backend.write({"u1": {"reminders_sent": 1}, "u2": {"goals": "run 5k"}})
+    backend.write({"u1": {"reminders_sent": 2}})
+    assert backend.read("u1") == {"reminders_sent": 2}
+    assert backend.read("u2") == {"goals": "run 5k"}
+    backend.remove("u1")
+    assert backend.read("u1") == {}
+
+def test_sqlite_backend_survives_restart(tmp_path):
+    """Test SQLite documents are visible to a new backend on the same file."""
+    path = str(tmp_path / "sessions.db")
+    SQLiteBackend(path).write({"u1": {"scheduled_time": "10:00"}})
+    assert SQLiteBackend(path).read("u1") == {"scheduled_time": "10:00"}
+
+def test_concurrent_increments_are_not_lost():
+    """Test increments from many threads all land on the same document."""
+    import threading
+    store = MemoryStore(InMemoryBackend(), cache_size=0)
+
+    def bump():
+        for _ in range(200):
+            store.increment("u1", "reminders_sent")
+            store.patch("u1", {"feedback": None})
+
+    threads = [threading.Thread(target=bump) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert store.get("u1")["reminders_sent"] == 1600
+
+def test_cached_increments_survive_concurrent_readers():
+    """Test readers filling the cache on a miss never cache a document older than a concurrent write."""
+    import threading
+
+    class SlowBackend(InMemoryBackend):
+        def read(self, user_id):
+            data = super().read(user_id)
+            time.sleep(0.0005)  # widen the window between reading and filling the cache
+            return data
+
+    # One slot, and readers alternate users, so nearly every get() is a miss that fills the cache
+    store = MemoryStore(SlowBackend(), cache_size=1)
+    done = threading.Event()
+
+    def bump():
+        for _ in range(200):
+            store.increment("u1", "reminders_sent")
+
+    def read():
+        while not done.is_set():
+            store.get("u1")
+            store.get("other")
+
+    writers = [threading.Thread(target=bump) for _ in range(4)]
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for t in readers + writers:
+        t.start()
+    for t in writers:
+        t.join()
+    done.set()
+    for t in readers:
+        t.join()
+    assert store.get("u1")["reminders_sent"] == 800
+
+def test_cached_stores_sharing_a_backend_keep_each_others_writes(tmp_path):
+    """Test two worker processes' stores on one SQLite file merge into the stored document, not their cached copy."""
+    path = str(tmp_path / "sessions.db")
+    worker_a = MemoryStore(SQLiteBackend(path), cache_size=10)
+    worker_b = MemoryStore(SQLiteBackend(path), cache_size=10)
+    worker_a.set("u1", {"last_exercise": "squats"})
+    assert worker_b.get("u1") == {"last_exercise": "squats"}  # now cached in worker B
+
+    worker_a.patch("u1", {"feedback": "done"})
+    worker_b.increment("u1", "reminders_sent")
+    worker_b.patch_many({"u1": {"completed": True}})
+    with worker_b.session("u1"):
+        worker_b.increment("u1", "reminders_sent")
+
+    assert SQLiteBackend(path).read("u1") == {"last_exercise": "squats", "feedback": "done",
+                                              "reminders_sent": 2, "completed": True}
+
+def test_patch_many_uses_one_read_and_one_write(monkeypatch):
+    """Test a bulk patch merges into existing documents with one batched read and write."""
+    backend = InMemoryBackend()
+    store = MemoryStore(backend, cache_size=0)
+    store.set("a", {"goals": "run"})
+    reads, writes = [], []
+    original_read_many, original_write = backend.read_many, backend.write
+    monkeypatch.setattr(backend, "read_many", lambda ids: reads.append(ids) or original_read_many(ids))
+    monkeypatch.setattr(backend, "write", lambda items: writes.append(list(items)) or original_write(items))
+
+    store.patch_many({"a": {"flag": 1}, "b": {"flag": 2}})
+
+    assert (len(reads), len(writes)) == (1, 1)
+    assert store.get("a") == {"goals": "run", "flag": 1}
+    assert store.get("b") == {"flag": 2}
+
+def test_session_flush_merges_concurrent_writes():
+    """Test a session flush keeps fields written outside it and applies increments as deltas."""
+    store = MemoryStore(InMemoryBackend(), cache_size=0)
+    store.set("u1", {"reminders_sent": 1})
+
+    with store.session("u1"):
+        assert store.increment("u1", "reminders_sent") == 2
+        store.patch("u1", {"last_exercise": "Do 15 squats"})
+        # Another worker writes while this run is in progress
+        store.backend.write({"u1": {"reminders_sent": 5, "feedback": "done"}})
+
+    assert store.get("u1") == {"reminders_sent": 6, "feedback": "done", "last_exercise": "Do 15 squats"}
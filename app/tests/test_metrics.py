@@ -0,0 +1,53 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.memory import memory_store
+from app.metrics import NODE_SECONDS, Registry, stats_collector
+
+client = TestClient(app)
+
+def test_histogram_and_collector_render_prometheus_text():
+    """Test histograms render cumulative buckets and collectors export component stats."""
+    registry = Registry()
+    latency = registry.histogram("op_seconds", "Op latency", ["op"], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 2):
+        latency.observe(value, op="read")
+    registry.counter("ops_total", "Ops", ["op"]).inc(op="read")
+    registry.register_collector(stats_collector("breaker", "Breaker", lambda: {
+        "state": "open", "failures": 3, "enabled": True, "history": []}))
+
+    lines = registry.render().splitlines()
+    assert "# TYPE op_seconds histogram" in lines
+    assert 'op_seconds_bucket{op="read",le="0.1"} 1' in lines
+    assert 'op_seconds_bucket{op="read",le="1"} 2' in lines
+    assert 'op_seconds_bucket{op="read",le="+Inf"} 3' in lines
+    assert 'op_seconds_count{op="read"} 3' in lines
+    assert 'ops_total{op="read"} 1' in lines
+    assert 'breaker_state{value="open"} 1' in lines
+    assert "breaker_failures 3" in lines and "breaker_enabled 1" in lines
+    assert not any(line.startswith("breaker_history") for line in lines)
+
+def test_metrics_endpoint_reports_nodes_store_and_requests():
+    """Test a chat turn is timed per node, store op and route, and the trace id is echoed."""
+    user_id = "metrics_user"
+    memory_store.clear(user_id)
+    before = NODE_SECONDS.count(node="schedule")
+    try:
+        response = client.post("/chat", json={"message": "Schedule my workout for 10:00", "user_id": user_id},
+                               headers={"X-Request-ID": "trace-abc"})
+        assert response.status_code == 200
+        assert response.headers["X-Request-ID"] == "trace-abc"
+        assert client.get("/").headers["X-Request-ID"] != "trace-abc"
+    finally:
+        memory_store.clear(user_id)
+    assert NODE_SECONDS.count(node="schedule") > before
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'agent_node_duration_seconds_count{node="schedule"}' in body
+    assert 'agent_routes_total{target="schedule"}' in body
+    assert 'store_operation_duration_seconds_count{op="read"}' in body
+    assert 'http_request_duration_seconds_count{method="POST",route="/chat",status="200"}' in body
+    assert "memory_cache_pending_writes" in body
+    assert "due_index_size" in body
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+import time
+from app.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+def test_llm_guard_retries_then_opens_breaker():
+    """Test transient errors are retried, repeated failures open the breaker and it recovers half-open."""
+    guard = ResilientCaller(CircuitBreaker(failure_threshold=2, reset_seconds=0.05),
+                            limit=2, attempts=3, base_delay=0, max_delay=0)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise TimeoutError("provider timeout")
+        return "ok"
+
+    assert guard.call(flaky) == "ok"
+    assert guard.stats()["retries"] == 2
+
+    def down():
+        raise TimeoutError("provider down")
+
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            guard.call(down)
+    assert guard.stats()["breaker_state"] == "open"
+    with pytest.raises(CircuitOpenError):
+        guard.call(lambda: "not called")
+
+    time.sleep(0.06)
+    assert guard.call(lambda: "recovered") == "recovered"
+    assert guard.stats()["breaker_state"] == "closed"
+
+def test_llm_guard_stops_retrying_at_the_call_deadline():
+    """Test retries never start past the call deadline and async attempts are cut off at it."""
+    guard = ResilientCaller(CircuitBreaker(failure_threshold=100), attempts=5,
+                            base_delay=0, max_delay=0, deadline=0.05)
+    attempts = []
+
+    def slow_timeout():
+        attempts.append(1)
+        time.sleep(0.03)
+        raise TimeoutError("provider timeout")
+
+    with pytest.raises(TimeoutError):
+        guard.call(slow_timeout)
+    assert len(attempts) == 2
+    assert guard.stats()["deadline_exceeded"] == 1
+
+    async def hangs():
+        await asyncio.sleep(5)
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        asyncio.run(guard.acall(hangs))
+    assert time.monotonic() - start < 1
+
+def test_cancelled_half_open_trial_frees_the_breaker():
+    """Test a half-open trial cancelled mid-call (e.g. a client disconnect) doesn't leave the breaker stuck."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    guard = ResilientCaller(breaker)
+
+    async def hangs():
+        await asyncio.sleep(5)
+
+    async def answer():
+        return "ok"
+
+    async def main():
+        trial = asyncio.create_task(guard.acall(hangs))
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half_open"
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        return await guard.acall(answer)
+
+    assert asyncio.run(main()) == "ok"
+    assert breaker.state == "closed"
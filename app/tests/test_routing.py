@@ -0,0 +1,31 @@
+from app.routing import IntentClassifier, INTENT_TABLE, route_input
+
+def test_keywords_match_whole_words_only():
+    """Test keywords inside other words no longer trigger an intent."""
+    classifier = IntentClassifier(INTENT_TABLE)
+    assert classifier.classify("Show me my plan") is None
+    assert classifier.classify("However, I finished") is None
+    assert classifier.classify("Somehow I missed it") is None
+    assert classifier.classify("How many squats?") == "question"
+    assert classifier.classify("What's a good stretch") == "question"
+
+def test_intent_priority_and_phrases():
+    """Test higher-priority intents win and phrases tolerate extra whitespace and case."""
+    classifier = IntentClassifier(INTENT_TABLE)
+    assert classifier.classify("What time should I schedule my workout?") == "schedule"
+    assert classifier.classify("Can you   CHECK  feedback") == "check_feedback"
+    assert classifier.classify("please send exercise") == "send_exercise"
+    assert classifier.classify("Rescheduling to 10:00") == "schedule"
+    assert classifier.classify("reschedule to 10:00") == "schedule"
+    assert classifier.classify("It's scheduled, how long is it?") == "schedule"
+
+def test_route_input_uses_configured_intents():
+    """Test a custom intent table drives routing and unmatched input falls back."""
+    from app import routing
+    original = routing.intent_classifier
+    try:
+        routing.configure_intents([("check_feedback", ["done", "finished"])])
+        assert route_input("I finished my squats", "routing_user") == "check_feedback"
+        assert route_input("How do I plank", "routing_user") == "send_exercise"
+    finally:
+        routing.intent_classifier = original
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+from app.due_index import DueIndex
+from app.memory import memory_store
+from app.tools import next_due_at, refresh_due
+import app.scheduler as scheduler
+
+def test_tick_runs_only_due_users(monkeypatch):
+    """Test the tick scans every user and runs the agent only for users with due work."""
+    now = datetime.now()
+    memory_store.set("due_user", {
+        "scheduled_hour": now.hour,
+        "scheduled_minute": now.minute,
+        "last_exercise_date": (now.date() - timedelta(days=1)).isoformat()
+    })
+    memory_store.set("idle_user", {"scheduled_time": None})
+    refresh_due("due_user")
+    refresh_due("idle_user")
+    ran = []
+    monkeypatch.setattr(scheduler, "run_user", lambda user_id, session=None: ran.append(user_id) or "ok")
+    try:
+        metrics = scheduler.hourly_agent_run()
+    finally:
+        memory_store.clear("due_user")
+        memory_store.clear("idle_user")
+
+    assert "due_user" in ran
+    assert "idle_user" not in ran
+    assert metrics["users_scanned"] >= 1
+    assert metrics["users_acted_on"] == len(ran)
+
+def test_due_index_pops_only_due_users_in_order():
+    """Test the index returns users due by now, earliest first, and honours rescheduling."""
+    now = datetime(2025, 1, 1, 12, 0)
+    index = DueIndex()
+    index.schedule("late", now + timedelta(hours=1))
+    index.schedule("second", now - timedelta(minutes=5))
+    index.schedule("first", now - timedelta(minutes=30))
+    index.schedule("moved", now - timedelta(minutes=10))
+    index.schedule("moved", now + timedelta(hours=2))
+
+    assert index.pop_due(now) == ["first", "second"]
+    assert index.pop_due(now) == []
+    assert len(index) == 2
+
+def test_next_due_at_exercise_and_reminders():
+    """Test the next due time covers the exercise window and the 2h/4h/6h reminders."""
+    now = datetime(2025, 1, 1, 9, 0)
+    scheduled = {"scheduled_hour": 10, "scheduled_minute": 45}
+    assert next_due_at("u", scheduled, now) == datetime(2025, 1, 1, 10, 15)
+
+    done_today = dict(scheduled, last_exercise_date="2025-01-01")
+    assert next_due_at("u", done_today, now) == datetime(2025, 1, 2, 10, 15)
+
+    waiting = {
+        "last_exercise": "Do 15 squats",
+        "exercise_sent_at": datetime(2025, 1, 1, 8, 0).isoformat(),
+        "reminders_sent": 1,
+    }
+    assert next_due_at("u", waiting, now) == datetime(2025, 1, 1, 12, 0)
+    assert next_due_at("u", dict(waiting, feedback="done"), now) is None
+
+def test_event_mode_registers_per_user_jobs(monkeypatch):
+    """Test event mode keeps one cron job per user and one-shot reminder jobs."""
+    from apscheduler.schedulers.background import BackgroundScheduler
+    jobs = BackgroundScheduler()
+    jobs.start(paused=True)
+    monkeypatch.setattr(scheduler, "scheduler", jobs)
+    monkeypatch.setattr(scheduler, "SCHEDULER_MODE", "event")
+    try:
+        scheduler.set_user_schedule(scheduler.SINGLE_USER_ID, "10:30")
+        scheduler.set_user_schedule(scheduler.SINGLE_USER_ID, "11:15")
+        exercise_job = jobs.get_job(scheduler.exercise_job_id(scheduler.SINGLE_USER_ID))
+        assert str(exercise_job.trigger) == "cron[hour='11', minute='15']"
+
+        sent_at = datetime.now()
+        scheduler.schedule_reminder_jobs("u1", sent_at)
+        run_dates = sorted(job.next_run_time.replace(tzinfo=None) for job in jobs.get_jobs()
+                           if job.id.startswith("reminder:u1:"))
+        assert run_dates == [sent_at + timedelta(hours=h) for h in (2, 4, 6)]
+
+        scheduler.cancel_reminder_jobs("u1")
+        assert [job.id for job in jobs.get_jobs() if job.id.startswith("reminder:")] == []
+    finally:
+        jobs.shutdown(wait=False)
+        memory_store.clear(scheduler.SINGLE_USER_ID)
+
+def test_event_mode_workers_write_jobs_to_the_shared_store(monkeypatch, tmp_path):
+    """Test an API worker with the scheduler disabled still adds and removes jobs in the shared job store."""
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    url = f"sqlite:///{tmp_path / 'jobs.sqlite'}"
+    monkeypatch.setattr(scheduler, "scheduler", None)
+    monkeypatch.setattr(scheduler, "SCHEDULER_MODE", "event")
+    monkeypatch.setattr(scheduler, "SCHEDULER_ENABLED", False)
+    monkeypatch.setattr(scheduler, "SCHEDULER_JOBSTORE_URL", url)
+    scheduler.start_scheduler()
+    try:
+        scheduler.set_user_schedule("worker_user", "07:45")
+        scheduler.schedule_reminder_jobs("worker_user", datetime.now())
+        # What the scheduler process would see in the shared store
+        shared = SQLAlchemyJobStore(url=url)
+        ids = {job.id for job in shared.get_all_jobs()}
+        assert scheduler.exercise_job_id("worker_user") in ids
+        assert scheduler.reminder_job_id("worker_user", 1) in ids
+
+        scheduler.cancel_reminder_jobs("worker_user")
+        assert {job.id for job in shared.get_all_jobs()} == {scheduler.exercise_job_id("worker_user")}
+        scheduler.remove_user("worker_user")
+        assert shared.get_all_jobs() == []
+    finally:
+        scheduler.scheduler.shutdown(wait=False)
+        memory_store.clear("worker_user")
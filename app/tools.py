@@ -1,7 +1,8 @@
 from app.memory import memory_store
+from app.due_index import due_index
 from datetime import datetime, timedelta
 import random
-from app.coach import fetch_coach_instructions, parse_coach_prompt
+from app.coach import coach_flags, DEFAULT_COACH_ID
 
 EXERCISES = [
     "Do 10 push-ups",
@@ -12,13 +13,12 @@ EXERCISES = [
     "Try 1 minute of deep breathing"
 ]
 
-def should_send_exercise(user_id: str) -> bool:
-    """Check if it's time to send exercise to user."""
-    session = memory_store.get(user_id) or {}
-    if not session.get("scheduled_hour"):
+def exercise_due(session: dict, now: datetime = None) -> bool:
+    """Check a loaded session for an exercise due at now."""
+    if session.get("scheduled_hour") is None:
         return False
         
-    now = datetime.now()
+    now = now or datetime.now()
     scheduled_hour = session.get("scheduled_hour")
     scheduled_minute = session.get("scheduled_minute", 0)
     
@@ -34,19 +34,17 @@ def should_send_exercise(user_id: str) -> bool:
     
     return False
 
-def should_send_reminder(user_id: str) -> bool:
-    """Check if we should send a reminder."""
-    session = memory_store.get(user_id) or {}
-    
+def reminder_due(user_id: str, session: dict, now: datetime = None) -> bool:
+    """Check a loaded session for a reminder due at now."""
     if not session.get("last_exercise") or session.get("feedback"):
         return False
     
+    now = now or datetime.now()
     # Check warning condition first
-    instruction = fetch_coach_instructions(user_id, "coach_001")  # Consistent coach_id
-    parsed_instruction = parse_coach_prompt(instruction.get("prompt", ""))
+    parsed_instruction = coach_flags(user_id, DEFAULT_COACH_ID, session)
     if parsed_instruction["warning_tone"] and session.get("last_exercise_date") and session.get("reminders_sent", 0) < 3:
         try:
-            days_since = (datetime.now().date() - datetime.fromisoformat(session["last_exercise_date"]).date()).days
+            days_since = (now.date() - datetime.fromisoformat(session["last_exercise_date"]).date()).days
             if days_since >= 3:
                 return True
         except ValueError:
@@ -58,7 +56,7 @@ def should_send_reminder(user_id: str) -> bool:
         return False
         
     exercise_time = datetime.fromisoformat(exercise_time_str)
-    hours_since = (datetime.now() - exercise_time).total_seconds() / 3600
+    hours_since = (now - exercise_time).total_seconds() / 3600
     reminders_sent = session.get("reminders_sent", 0)
     
     # Send reminders at 2h, 4h, 6h after exercise
@@ -69,30 +67,81 @@ def should_send_reminder(user_id: str) -> bool:
         
     return False
 
+def next_due_at(user_id: str, session: dict, now: datetime = None):
+    """Earliest time exercise_due or reminder_due can next be true, or None."""
+    now = now or datetime.now()
+    candidates = []
+    
+    scheduled_hour = session.get("scheduled_hour")
+    if scheduled_hour is not None:
+        scheduled_minute = session.get("scheduled_minute", 0)
+        # The exercise window opens 30 minutes early but never leaves the scheduled hour
+        window_start = now.replace(hour=scheduled_hour, minute=max(0, scheduled_minute - 30), second=0, microsecond=0)
+        window_end = now.replace(hour=scheduled_hour, minute=min(59, scheduled_minute + 30), second=59, microsecond=0)
+        if session.get("last_exercise_date") == now.date().isoformat() or now > window_end:
+            window_start += timedelta(days=1)
+        candidates.append(window_start)
+    
+    reminders_sent = session.get("reminders_sent", 0)
+    if session.get("last_exercise") and not session.get("feedback") and reminders_sent < 3:
+        if session.get("exercise_sent_at"):
+            sent_at = datetime.fromisoformat(session["exercise_sent_at"])
+            candidates.append(sent_at + timedelta(hours=2 * (reminders_sent + 1)))
+        if session.get("last_exercise_date"):
+            if coach_flags(user_id, DEFAULT_COACH_ID, session)["warning_tone"]:
+                candidates.append(datetime.fromisoformat(session["last_exercise_date"]) + timedelta(days=3))
+    
+    return min(candidates) if candidates else None
+
+def refresh_due(user_id: str):
+    """Recompute the user's entry in the due-time index after a state change."""
+    due_index.schedule(user_id, next_due_at(user_id, memory_store.get(user_id) or {}))
+
+def refresh_due_many(user_ids):
+    """refresh_due for many users with one batched read."""
+    sessions = memory_store.get_many(user_ids)
+    now = datetime.now()
+    for user_id, session in sessions.items():
+        due_index.schedule(user_id, next_due_at(user_id, session, now))
+
+def should_send_exercise(user_id: str) -> bool:
+    """Check if it's time to send exercise to user."""
+    return exercise_due(memory_store.get(user_id) or {})
+
+def should_send_reminder(user_id: str) -> bool:
+    """Check if we should send a reminder."""
+    return reminder_due(user_id, memory_store.get(user_id) or {})
+
 def send_exercise_fn(user_id: str) -> str:
     """Send a new exercise to the user."""
     exercise = random.choice(EXERCISES)
     now = datetime.now()
     
-    memory_store.update(user_id, {
+    memory_store.patch(user_id, {
         "last_exercise": exercise,
         "feedback": None,
+        "completed": False,
         "reminders_sent": 0,
         "exercise_sent_at": now.isoformat(),
         "last_exercise_date": now.date().isoformat()
     })
     
+    refresh_due(user_id)
+    from app.scheduler import schedule_reminder_jobs
+    schedule_reminder_jobs(user_id, now)
+    
     return EXERCISES[0]  # TODO: Remove this; just for testing
 
 def send_reminder_fn(user_id: str) -> str:
     """Send a reminder to the user."""
     session = memory_store.get(user_id) or {}
     exercise = session.get("last_exercise", "your exercise")
-    reminders_sent = session.get("reminders_sent", 0)
     
-    memory_store.update(user_id, {"reminders_sent": reminders_sent + 1})
+    # Atomic so concurrent runs for the same user never lose a count
+    reminders_sent = memory_store.increment(user_id, "reminders_sent")
+    refresh_due(user_id)
     
-    return f"Reminder {reminders_sent + 1}/3: Don't forget to complete: {exercise}"
+    return f"Reminder {reminders_sent}/3: Don't forget to complete: {exercise}"
 
 def check_feedback_fn(user_id: str) -> str:
     """Check for user feedback."""
@@ -106,5 +155,29 @@ def check_feedback_fn(user_id: str) -> str:
 def schedule_session_fn(user_id: str, time_str: str) -> str:
     """Schedule a workout session."""
     from app.scheduler import set_user_schedule
-    set_user_schedule(time_str)
-    return f"Scheduled for {time_str} daily"
\ No newline at end of file
+    set_user_schedule(user_id, time_str)
+    return f"Scheduled for {time_str} daily"
+
+# Fields session_status reads; bulk status loads only these
+STATUS_FIELDS = ("scheduled_time", "last_exercise", "last_exercise_date", "feedback", "reminders_sent")
+
+def session_status(session: dict) -> dict:
+    """Summarise a user's exercise state from their (possibly projected) session."""
+    if not session.get("scheduled_time") and not session.get("last_exercise"):
+        return {"status": "not_scheduled"}
+    
+    if not session.get("last_exercise"):
+        status = "scheduled"
+    elif not session.get("feedback"):
+        status = "waiting_feedback"
+    else:
+        status = "completed"
+    
+    return {
+        "status": status,
+        "scheduled_time": session.get("scheduled_time"),
+        "last_exercise": session.get("last_exercise"),
+        "last_exercise_date": session.get("last_exercise_date"),
+        "feedback": session.get("feedback"),
+        "reminders_sent": session.get("reminders_sent", 0)
+    }
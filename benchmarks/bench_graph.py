@@ -0,0 +1,60 @@
+# benchmarks/bench_graph.py
+"""Compare per-request latency: run_agent rebuilding the graph vs. using the cached one.
+
+Requests run the whole agent turn against the in-memory backend with the
+deterministic fake LLM from bench_suite.py, so the difference between the two
+figures is what compiling the graph costs each request.
+
+Run from the project root:
+    python benchmarks/bench_graph.py --requests 200
+"""
+import argparse
+import time
+
+# Sets up the environment (in-memory backend, no scheduler) before the app is imported
+from bench_suite import FakeLLM, latency_summary, make_state, reset_state
+
+import app.agent as agent
+
+
+def time_requests(requests: int, users: int) -> list:
+    """Run requests agent turns and return each one's latency in seconds."""
+    reset_state()
+    latencies = []
+    for n in range(requests):
+        state = make_state(n, users)
+        start = time.perf_counter()
+        agent.run_agent(state)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20, help="distinct users the requests are spread over")
+    args = parser.parse_args()
+
+    agent.llm = FakeLLM()
+    cached_get_graph = agent.get_graph
+    agent.run_agent(make_state(0, args.users))  # warm imports and the cache outside the timing
+
+    # Before: every request compiles its own graph, as run_agent did originally
+    agent.get_graph = lambda async_mode=False: agent.build_graph(async_mode)
+    try:
+        before = latency_summary(time_requests(args.requests, args.users))
+    finally:
+        agent.get_graph = cached_get_graph
+    after = latency_summary(time_requests(args.requests, args.users))
+    reset_state()
+
+    print(f"requests:                      {args.requests}")
+    print(f"before (graph built per run):  mean {before['mean_ms']:.3f} ms, p50 {before['p50_ms']:.3f} ms, "
+          f"p99 {before['p99_ms']:.3f} ms")
+    print(f"after (cached graph):          mean {after['mean_ms']:.3f} ms, p50 {after['p50_ms']:.3f} ms, "
+          f"p99 {after['p99_ms']:.3f} ms")
+    print(f"saved per request:             {before['mean_ms'] - after['mean_ms']:.3f} ms (mean)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/bench_routing.py
+"""Microbenchmark the intent classifier against the old substring chain.
+
+Run from the project root:
+    python benchmarks/bench_routing.py --repeat 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+from app.routing import INTENT_TABLE, IntentClassifier, intent_classifier
+
+CORPUS = [
+    "Schedule my workout for 10:00",
+    "Can you reschedule my session to 7:30 pm?",
+    "What's a good exercise for my back?",
+    "How many push-ups should I do?",
+    "Why do my legs hurt after squats?",
+    "check feedback",
+    "send exercise",
+    "I did the exercise",
+    "Show me my plan for today",
+    "However, I finished the plank early",
+    "Somehow I missed yesterday's session",
+    "Done! That was hard but I completed all the lunges and the breathing.",
+    "hello",
+    "",
+    "I'd like to know whether walking counts as exercise or if I should do something more intense "
+    "like running, and also what the best time of day to train is given my work schedule",
+]
+
+def legacy_intent(user_input: str):
+    """The substring chain route_input used before the compiled classifier."""
+    user_input = user_input.lower()
+    if "schedule" in user_input:
+        return "schedule"
+    elif "how" in user_input or "what" in user_input or "why" in user_input:
+        return "question"
+    elif "check feedback" in user_input:
+        return "check_feedback"
+    elif "send exercise" in user_input:
+        return "send_exercise"
+    return None
+
+def substring_router(table):
+    """A legacy-style router generalised to any intent table: one scan per keyword."""
+    def route(user_input: str):
+        user_input = user_input.lower()
+        for intent, keywords in table:
+            if any(keyword.rstrip("*") in user_input for keyword in keywords):
+                return intent
+        return None
+    return route
+
+def padded_table(extra_keywords: int):
+    """INTENT_TABLE plus filler intents that never match the corpus."""
+    filler = [(f"filler_{n}", [f"zzfiller{n}a", f"zzfiller{n}b"]) for n in range(extra_keywords // 2)]
+    return list(INTENT_TABLE) + filler
+
+def time_per_message(fn, repeat: int) -> float:
+    """Return mean microseconds per classified message."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in CORPUS:
+            fn(message)
+    return (time.perf_counter() - start) * 1e6 / (repeat * len(CORPUS))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--table-sizes", type=int, nargs="*", default=[0, 50, 200],
+                        help="extra keywords added to the intent table for the scaling run")
+    args = parser.parse_args()
+
+    legacy = time_per_message(legacy_intent, args.repeat)
+    compiled = time_per_message(intent_classifier.classify, args.repeat)
+    print(f"messages:             {len(CORPUS)} x {args.repeat}")
+    print(f"legacy substring:     {legacy:.2f} us/message")
+    print(f"compiled classifier:  {compiled:.2f} us/message")
+
+    print("\nmessages routed differently (legacy -> compiled):")
+    for message in CORPUS:
+        before, after = legacy_intent(message), intent_classifier.classify(message)
+        if before != after:
+            print(f"  {message[:60]!r}: {before} -> {after}")
+
+    print("\nscaling with intent table size (us/message):")
+    for extra in args.table_sizes:
+        table = padded_table(extra)
+        keywords = sum(len(words) for _, words in table)
+        naive = time_per_message(substring_router(table), args.repeat // 10 or 1)
+        single = time_per_message(IntentClassifier(table).classify, args.repeat // 10 or 1)
+        print(f"  {keywords:>4} keywords: substring {naive:7.2f}   compiled {single:7.2f}")
+
+if __name__ == "__main__":
+    main()
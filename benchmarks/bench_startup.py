@@ -0,0 +1,68 @@
+# benchmarks/bench_startup.py
+"""Cold-start regression benchmark: fresh-interpreter import time of the app.
+
+Each run imports the module in a new interpreter and reports the median.
+Also fails if any of the heavy dependencies that should load lazily were imported.
+
+Run from the project root:
+    python benchmarks/bench_startup.py --runs 5 --budget 1.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use (LLM call, store access, scheduler start), never by the import
+LAZY_MODULES = ["chromadb", "langchain_openai", "openai", "langgraph.graph", "apscheduler.schedulers"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+def cold_import(module: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, lazy=LAZY_MODULES)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=None,
+                        help="fail if the median import takes longer than this many seconds")
+    args = parser.parse_args()
+
+    samples = [cold_import(args.module) for _ in range(args.runs)]
+    seconds = sorted(sample["seconds"] for sample in samples)
+    loaded = samples[-1]["loaded"]
+    median = statistics.median(seconds)
+
+    print(f"module:          {args.module}")
+    print(f"runs:            {args.runs}")
+    print(f"median import:   {median * 1000:.0f} ms")
+    print(f"min / max:       {seconds[0] * 1000:.0f} / {seconds[-1] * 1000:.0f} ms")
+    print(f"eager heavy deps: {', '.join(loaded) or 'none'}")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: {', '.join(loaded)} imported at startup")
+        failed = True
+    if args.budget is not None and median > args.budget:
+        print(f"FAIL: median {median:.2f}s over the {args.budget:.2f}s budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
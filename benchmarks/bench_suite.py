@@ -0,0 +1,278 @@
+# benchmarks/bench_suite.py
+"""End-to-end benchmark suite with a deterministic fake LLM and in-memory store.
+
+Measures run_agent throughput, /chat latency under concurrent load, scheduler
+tick time for N due users and MemoryStore operations per second, and writes
+the results as JSON so runs can be compared.
+
+Run from the project root:
+    python benchmarks/bench_suite.py --output bench_results.json
+    python benchmarks/bench_suite.py --output after.json --compare bench_results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+# No network, no disk: everything below runs against process-local state
+os.environ["MEMORY_BACKEND"] = "memory"
+os.environ["SCHEDULER_ENABLED"] = "false"
+
+import app.agent as agent
+from app.agent import AgentState, run_agent
+from app.answer_cache import answer_cache
+from app.backends import InMemoryBackend
+from app.due_index import due_index
+from app.memory import MemoryStore, memory_store
+import app.scheduler as scheduler
+
+CORPUS = [
+    "Schedule my workout for 10:00",
+    "How do I hold a plank?",
+    "What's a good exercise for my back?",
+    "check feedback",
+    "send exercise",
+    "I did the exercise",
+    "Why do my legs hurt after squats?",
+    "hello",
+]
+
+class FakeLLM:
+    """Chat model stand-in: the answer depends only on the prompt, after a fixed delay."""
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+
+    def _answer(self, prompt):
+        return SimpleNamespace(content=f"Benchmark answer {zlib.crc32(str(prompt).encode()) % 1000}.")
+
+    def invoke(self, prompt):
+        time.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+
+    def batch(self, prompts, config=None, return_exceptions=False):
+        time.sleep(self.latency)
+        return [self._answer(prompt) for prompt in prompts]
+
+def percentile(sorted_values, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+def latency_summary(seconds) -> dict:
+    values = sorted(value * 1000 for value in seconds)
+    return {
+        "p50_ms": round(percentile(values, 50), 3),
+        "p90_ms": round(percentile(values, 90), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0,
+        "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+    }
+
+def make_state(n: int, users: int) -> AgentState:
+    return AgentState(input=CORPUS[n % len(CORPUS)], user_id=f"bench_user_{n % users}",
+                      coach_id="coach123", node_output="", output="")
+
+def reset_state():
+    for user_id in memory_store.user_ids():
+        memory_store.clear(user_id)
+    due_index.clear()
+    answer_cache.clear()
+
+def bench_run_agent(requests: int, users: int, concurrency: int) -> dict:
+    """run_agent throughput, sequentially and from a thread pool."""
+    reset_state()
+    run_agent(make_state(0, users))  # compile the graph outside the timing
+
+    def timed_run(n):
+        start = time.perf_counter()
+        run_agent(make_state(n, users))
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    sequential = [timed_run(n) for n in range(requests)]
+    sequential_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        threaded = list(pool.map(timed_run, range(requests)))
+    threaded_elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "users": users,
+        "sequential": dict(latency_summary(sequential), requests_per_second=round(requests / sequential_elapsed, 1)),
+        "threaded": dict(latency_summary(threaded), concurrency=concurrency,
+                         requests_per_second=round(requests / threaded_elapsed, 1)),
+        "answer_cache": answer_cache.stats(),
+    }
+
+async def _load_chat(requests: int, users: int, concurrency: int):
+    import httpx
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    limit = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(n):
+            async with limit:
+                body = {"message": CORPUS[n % len(CORPUS)], "user_id": f"bench_user_{n % users}"}
+                start = time.perf_counter()
+                response = await client.post("/chat", json=body)
+                return time.perf_counter() - start, response.status_code
+
+        await one(0)  # warm-up
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(n) for n in range(requests)))
+        return results, time.perf_counter() - start
+
+def bench_chat(requests: int, users: int, concurrency: int) -> dict:
+    """/chat latency percentiles with `concurrency` requests in flight, in process over ASGI."""
+    reset_state()
+    results, elapsed = asyncio.run(_load_chat(requests, users, concurrency))
+    return dict(
+        latency_summary([seconds for seconds, _ in results]),
+        requests=requests,
+        concurrency=concurrency,
+        errors=sum(1 for _, status in results if status != 200),
+        requests_per_second=round(requests / elapsed, 1),
+    )
+
+def bench_tick(users: int) -> dict:
+    """One scheduler tick over `users` users that each have a reminder due."""
+    reset_state()
+    sent_at = (datetime.now() - timedelta(hours=3)).isoformat()
+    memory_store.patch_many({
+        f"tick_user_{n}": {"last_exercise": "Push-ups", "exercise_sent_at": sent_at, "reminders_sent": 0}
+        for n in range(users)
+    })
+    due_index.ready = False
+    start = time.perf_counter()
+    metrics = scheduler.hourly_agent_run()
+    elapsed = time.perf_counter() - start
+    return {
+        "users": users,
+        "seconds": round(elapsed, 4),
+        "users_per_second": round(users / elapsed, 1),
+        "users_acted_on": metrics["users_acted_on"],
+        "errors": metrics["errors"],
+    }
+
+def ops_per_second(fn, count: int) -> float:
+    start = time.perf_counter()
+    for n in range(count):
+        fn(n)
+    return round(count / (time.perf_counter() - start), 1)
+
+def bench_store(ops: int, batch: int) -> dict:
+    """MemoryStore operations per second on an in-memory backend, with and without the cache."""
+    results = {}
+    for label, cache_size in (("cached", ops), ("uncached", 0)):
+        store = MemoryStore(backend=InMemoryBackend(), cache_size=cache_size)
+        keys = [f"store_user_{n}" for n in range(ops)]
+        batches = [keys[start:start + batch] for start in range(0, ops, batch)]
+        rounds = max(1, ops // batch)
+        results[label] = {
+            "set": ops_per_second(lambda n: store.set(keys[n], {"scheduled_time": "10:00", "reminders_sent": 0}), ops),
+            "get": ops_per_second(lambda n: store.get(keys[n]), ops),
+            "patch": ops_per_second(lambda n: store.patch(keys[n], {"feedback": "done"}), ops),
+            "increment": ops_per_second(lambda n: store.increment(keys[n], "reminders_sent"), ops),
+            "get_many_users": round(ops_per_second(lambda n: store.get_many(batches[n % len(batches)]), rounds) * batch, 1),
+            "patch_many_users": round(ops_per_second(
+                lambda n: store.patch_many({key: {"completed": True} for key in batches[n % len(batches)]}), rounds) * batch, 1),
+        }
+    results["batch"] = batch
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """{"a": {"b": 1}} -> {"a.b": 1}, numbers only."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare(current: dict, baseline: dict):
+    before, after = flatten(baseline["results"]), flatten(current["results"])
+    print(f"\nchange vs. {baseline['meta'].get('commit', '?')}:")
+    for name, value in after.items():
+        old = before.get(name)
+        if old:
+            print(f"  {name:<45} {old:>12} -> {value:>12}  ({(value - old) / old * 100:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400, help="agent runs and /chat requests per scenario")
+    parser.add_argument("--users", type=int, default=50, help="distinct users the requests are spread over")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--tick-users", type=int, default=1000)
+    parser.add_argument("--store-ops", type=int, default=20000)
+    parser.add_argument("--store-batch", type=int, default=100)
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="simulated LLM response time")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to print changes against")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    agent.llm = FakeLLM(args.llm_latency_ms)
+
+    results = {}
+    print("run_agent ...", flush=True)
+    results["run_agent"] = bench_run_agent(args.requests, args.users, args.concurrency)
+    print("/chat ...", flush=True)
+    results["chat"] = bench_chat(args.requests, args.users, args.concurrency)
+    print("scheduler tick ...", flush=True)
+    results["scheduler_tick"] = bench_tick(args.tick_users)
+    print("MemoryStore ...", flush=True)
+    results["memory_store"] = bench_store(args.store_ops, args.store_batch)
+    reset_state()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(results, indent=2))
+    print(f"\nwritten to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
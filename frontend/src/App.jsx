@@ -88,19 +88,57 @@ function App() {
     ])
 
     try {
-      const response = await axios.post(`${API_BASE_URL}/chat`, {
-        message: userMessage,
+      const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+        body: JSON.stringify({ message: userMessage, user_id: USER_ID }),
       })
+      if (!response.ok || !response.body) {
+        throw new Error(`Stream request failed with status ${response.status}`)
+      }
 
-      // Add agent response to chat
+      // Add an empty agent message and fill it in as chunks arrive
       setChatMessages((prev) => [
         ...prev,
         {
           type: "agent",
-          content: response.data.response,
+          content: "",
           timestamp: new Date().toLocaleTimeString(),
         },
       ])
+      const appendToAgentMessage = (text) => {
+        setChatMessages((prev) => {
+          const updated = [...prev]
+          const last = updated[updated.length - 1]
+          updated[updated.length - 1] = { ...last, content: last.content + text }
+          return updated
+        })
+      }
+
+      // Parse server-sent events: "event: <name>" and "data: <json>" lines, blank line between events
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ""
+      let done = false
+      while (!done) {
+        const result = await reader.read()
+        if (result.done) break
+        buffer += decoder.decode(result.value, { stream: true })
+        const events = buffer.split("\n\n")
+        buffer = events.pop()
+        for (const rawEvent of events) {
+          const lines = rawEvent.split("\n")
+          const eventName = lines.find((line) => line.startsWith("event: "))?.slice(7) || "message"
+          const data = lines.find((line) => line.startsWith("data: "))?.slice(6)
+          if (eventName === "done") {
+            done = true
+          } else if (eventName === "error") {
+            throw new Error(JSON.parse(data))
+          } else if (data) {
+            appendToAgentMessage(JSON.parse(data))
+          }
+        }
+      }
     } catch (err) {
       console.error("Chat submission error:", err)
       setError(err.response?.data?.detail || "Failed to send message. Please try again.")
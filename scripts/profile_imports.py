@@ -0,0 +1,54 @@
+# scripts/profile_imports.py
+"""Summarise `python -X importtime` for a module: slowest imports and top-level packages.
+
+Run from the project root:
+    python scripts/profile_imports.py app.main --top 25
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_times(module: str):
+    """Return [(self_us, cumulative_us, depth, name)] from a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("module", nargs="?", default="app.main")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    total = next((cumulative for _, cumulative, _, name in rows if name == args.module), 0)
+    print(f"{args.module}: {total / 1000:.1f} ms total, {len(rows)} modules imported\n")
+
+    print(f"slowest imports by cumulative time (top {args.top}):")
+    for self_us, cumulative_us, depth, name in sorted(rows, key=lambda row: -row[1])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {self_us / 1000:7.1f} ms self  {'  ' * depth}{name}")
+
+    packages = defaultdict(int)
+    for self_us, _, _, name in rows:
+        packages[name.split(".")[0]] += self_us
+    print(f"\nself time by top-level package (top {args.top}):")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {package}")
+
+if __name__ == "__main__":
+    main()